@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from recipes.constants import CACHE_STATS_FLUSH_SIZE, LOCAL_STATE_MAX_AGE
+
+VERSION_KEY = 'api:version:{}'
+STATS_KEY = 'api:stats:{}'
+RESPONSE_KEY = 'api:response:{}:{}:{}'
+EVENTS = ('hit', 'miss')
+
+
+stats_lock = threading.Lock()
+pending_stats = Counter()
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_version_cache():
+    """Кеш версий и статистики, ключи которого не вытесняются."""
+    return caches[settings.API_VERSION_CACHE_ALIAS]
+
+
+def initial_version():
+    """Стартовое значение счётчика.
+
+    Берём время, чтобы после вытеснения счётчика из кеша новая версия
+    была больше всех старых и не совпала с закешированными ответами.
+    """
+    return time.time_ns()
+
+
+def get_versions(*names):
+    """Возвращает текущие версии данных для перечисленных имён."""
+    cache = get_version_cache()
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(name):
+    """Увеличивает версию данных, делая устаревшими зависящие ответы."""
+    cache = get_version_cache()
+    key = VERSION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, initial_version(), timeout=None)
+
+
+class VersionedState:
+    """Данные в памяти процесса, привязанные к версии в общем кеше.
+
+    Перестраиваются при смене версии и не реже раза в LOCAL_STATE_MAX_AGE
+    секунд, чтобы записи в обход сигналов тоже были видны.
+    """
+
+    version_name = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def is_current(self, state, version):
+        return (
+            state is not None and state[0] == version
+            and time.monotonic() - state[1] < LOCAL_STATE_MAX_AGE
+        )
+
+    def get_state(self):
+        version, = get_versions(self.version_name)
+        state = self.state
+        if not self.is_current(state, version):
+            with self.lock:
+                state = self.state
+                if not self.is_current(state, version):
+                    state = self.state = (
+                        version, time.monotonic(), self.build()
+                    )
+        return state[2]
+
+
+def record(event):
+    """Считает попадание или промах в памяти процесса.
+
+    В общий кеш счётчики сбрасываются раз в CACHE_STATS_FLUSH_SIZE
+    событий, чтобы не писать в него на каждом запросе.
+    """
+    with stats_lock:
+        pending_stats[event] += 1
+        if sum(pending_stats.values()) < CACHE_STATS_FLUSH_SIZE:
+            return
+        counts = dict(pending_stats)
+        pending_stats.clear()
+    flush_stats(counts)
+
+
+def flush_stats(counts):
+    cache = get_version_cache()
+    for event, count in counts.items():
+        key = STATS_KEY.format(event)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+
+
+def get_stats():
+    """Приблизительные счётчики попаданий и промахов кеша ответов.
+
+    Общий кеш не увеличивает счётчики атомарно, а события, ещё не
+    сброшенные другими процессами, не учитываются.
+    """
+    cache = get_version_cache()
+    stats = cache.get_many([STATS_KEY.format(event) for event in EVENTS])
+    with stats_lock:
+        return {
+            event: stats.get(STATS_KEY.format(event), 0)
+            + pending_stats[event]
+            for event in EVENTS
+        }
+
+
+def reset_stats():
+    with stats_lock:
+        pending_stats.clear()
+    get_version_cache().delete_many(
+        [STATS_KEY.format(event) for event in EVENTS]
+    )
+
+
+def normalize_query(query_params):
+    return '&'.join(
+        f'{key}={value}'
+        for key in sorted(query_params)
+        for value in sorted(query_params.getlist(key))
+    )
+
+
+class AnonymousCacheMixin:
+    """Кеширует ответы list/retrieve для анонимных пользователей.
+
+    Ключ содержит версии данных из ``cache_versions``, поэтому запись
+    в любую из связанных моделей делает закешированные ответы недоступными.
+    """
+
+    cache_versions = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cache_key(self, request):
+        versions = ':'.join(map(str, get_versions(*self.cache_versions)))
+        query = hashlib.md5('|'.join((
+            request.scheme,
+            request.get_host(),
+            request.path,
+            normalize_query(request.query_params),
+        )).encode()).hexdigest()
+        return RESPONSE_KEY.format(self.basename, versions, query)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record('hit')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        record('miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def check_api_cache(app_configs, **kwargs):
+    """Кеши ответов и версий должны быть общими для всех процессов."""
+    if settings.DEBUG:
+        return []
+    errors = []
+    for alias in (settings.API_CACHE_ALIAS, settings.API_VERSION_CACHE_ALIAS):
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_BACKENDS:
+            errors.append(Error(
+                f'Кеш {alias!r} ({backend}) виден только одному процессу: '
+                'записи в других воркерах и командах не сбросят '
+                'закешированные ответы и индексы.',
+                hint='Укажите общий кеш: файловый, memcached '
+                     'или в базе данных.',
+                id='api.E001',
+            ))
+    return errors
@@ -1,7 +1,25 @@
 import django_filters
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import CharFilter, FilterSet
 
+from api.tag_index import tag_index
 from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+TAGS_MODES = (('any', 'Любой из тегов'), ('all', 'Все теги'))
+RecipeTag = Recipe.tags.through
+
+
+class MultipleValueField(forms.MultipleChoiceField):
+    """Список значений из повторяющегося параметра без набора choices."""
+
+    def valid_value(self, value):
+        return True
+
+
+class MultipleValueFilter(django_filters.Filter):
+    field_class = MultipleValueField
 
 
 class IngredientFilter(FilterSet):
@@ -17,24 +35,52 @@ class IngredientFilter(FilterSet):
 class RecipeFilter(FilterSet):
     """Фильтр для рецептов."""
 
-    tags = django_filters.AllValuesMultipleFilter(
-        field_name='tags__slug', lookup_expr='icontains'
+    tags = MultipleValueFilter(method='get_tags')
+    tags_mode = django_filters.ChoiceFilter(
+        choices=TAGS_MODES, method='get_tags_mode'
     )
     is_in_shopping_cart = django_filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
     is_favorited = django_filters.NumberFilter(method='get_is_in_favorite')
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_in_shopping_cart', 'is_favorited']
+        fields = [
+            'tags', 'tags_mode', 'author', 'is_in_shopping_cart',
+            'is_favorited', 'search'
+        ]
+
+    def get_tags(self, queryset, name, value):
+        """Точное совпадение слагов через EXISTS, без JOIN и DISTINCT."""
+        ids, unknown = tag_index.resolve(value)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            if unknown:
+                return queryset.none()
+            for tag_id in ids:
+                queryset = queryset.filter(Exists(RecipeTag.objects.filter(
+                    recipe_id=OuterRef('pk'), tag_id=tag_id
+                )))
+            return queryset
+        if not ids:
+            return queryset.none()
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=ids
+        )))
+
+    def get_tags_mode(self, queryset, name, value):
+        return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(cart_recipes__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     def get_is_in_favorite(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(user_favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
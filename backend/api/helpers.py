@@ -1,33 +1,481 @@
 import base64
+import binascii
+import csv
+import json
+import os
 import uuid
+from copy import copy
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db.models import Q
 from rest_framework import pagination, serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-from recipes.constants import PAGE_SIZE
+from api.uploads import UploadError, UploadSession
+from recipes.constants import (BASE64_CHUNK_SIZE, MAX_IMAGE_PIXELS, PAGE_SIZE,
+                               SHORT_LINK_ALPHABET, SHORT_LINK_MAX_POSTFIX,
+                               UPLOAD_PREFIX)
+from recipes.images import get_variant_names, strip_metadata
+from recipes.timeline import read_feed
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл с декодированной картинкой.
+
+    Хранилище может переместить его на место картинки, поэтому файл
+    закрывается сам, когда больше не нужен.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def decode_base64_file(encoded, name):
+    """Декодирует base64 частями во временный файл на диске.
+
+    В памяти одновременно держится только одна часть строки, а не вся
+    картинка целиком.
+    """
+    file = DecodedImageFile(name, 'application/octet-stream', 0, None)
+    carry = ''
+    for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+        chunk = carry + ''.join(
+            encoded[start:start + BASE64_CHUNK_SIZE].split()
+        )
+        usable = len(chunk) - len(chunk) % 4
+        file.write(base64.b64decode(chunk[:usable], validate=True))
+        carry = chunk[usable:]
+    if carry:
+        file.close()
+        raise binascii.Error('Incorrect padding')
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+def strip_image_metadata(file):
+    """Убирает метаданные из принятой картинки до её сохранения.
+
+    Файл на диске переписывается на месте, поэтому открытый на него
+    дескриптор читает уже очищенное содержимое.
+    """
+    if hasattr(file, 'temporary_file_path'):
+        path = file.temporary_file_path()
+        if strip_metadata(path, path):
+            file.size = os.path.getsize(path)
+        return
+    file.seek(0)
+    stripped = BytesIO()
+    if strip_metadata(file, stripped):
+        file.file = stripped
+        file.size = stripped.tell()
+    file.seek(0)
 
 
 class Base64ImageField(serializers.ImageField):
-    """Превращаем картинку из запроса в картинку-файл."""
+    """Превращаем картинку из запроса в картинку-файл.
+
+    Кроме строки base64 принимает ``upload:<id>`` — ссылку на файл,
+    загруженный через /api/uploads/.
+    """
+
+    default_error_messages = {
+        'too_large': 'Картинка больше {max_pixels} пикселей.',
+        'upload': '{message}',
+    }
 
     def to_internal_value(self, data):
         """Преобразует строку base64 в ImageField."""
-        if isinstance(data, str) and data.startswith('data:image'):
+        if isinstance(data, str) and data.startswith(UPLOAD_PREFIX):
+            try:
+                data = UploadSession(
+                    self.context['request'].user, data[len(UPLOAD_PREFIX):]
+                ).open()
+            except UploadError as error:
+                self.fail('upload', message=str(error))
+        elif isinstance(data, str) and data.startswith('data:image'):
             format, image = data.split(';base64,')
-            data = ContentFile(
-                base64.b64decode(image), name=f'{uuid.uuid4()}.jpg'
-            )
-        return super().to_internal_value(data)
+            try:
+                data = decode_base64_file(image, name=f'{uuid.uuid4()}.jpg')
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
+        file = super().to_internal_value(data)
+        image = getattr(file, 'image', None)
+        if image is not None and image.width * image.height > MAX_IMAGE_PIXELS:
+            self.fail('too_large', max_pixels=MAX_IMAGE_PIXELS)
+        strip_image_metadata(file)
+        return file
+
+
+def get_file_url(storage, name, request):
+    """Ссылка на файл так же, как её строит ImageField сериализатора."""
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def get_image_variants(storage, name, request):
+    """Ссылки на уменьшенные копии картинки по размерам и форматам."""
+    if not name:
+        return None
+    return {
+        variant: {
+            image_format: get_file_url(storage, variant_name, request)
+            for image_format, variant_name in names.items()
+        }
+        for variant, names in get_variant_names(name).items()
+    }
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки из поля модели."""
+
+    def to_representation(self, value):
+        return get_image_variants(
+            value.storage, value.name, self.context.get('request')
+        )
+
+
+def resolve_pks(queryset, pks, cache=None):
+    """Объекты по списку первичных ключей одним запросом.
+
+    Возвращает объекты в порядке ключей и ключи, которых нет в базе.
+    В cache хранятся уже найденные (и не найденные) объекты, так что
+    несколько списков подряд не запрашивают одно и то же повторно.
+    """
+    if cache is None:
+        cache = {}
+    unknown = set(pks) - cache.keys()
+    if unknown:
+        found = queryset.in_bulk(unknown)
+        cache.update({pk: found.get(pk) for pk in unknown})
+    return (
+        [cache[pk] for pk in pks],
+        [pk for pk in pks if cache[pk] is None]
+    )
+
+
+def get_related_cache(context, model):
+    """Общий для нескольких сериализаторов кэш объектов model."""
+    if 'related_objects' not in context:
+        return None
+    return context['related_objects'].setdefault(model, {})
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Список связанных объектов, загружаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        child = self.child_relation
+        queryset = child.get_queryset()
+        objects, missing = resolve_pks(
+            queryset, super().to_internal_value(data),
+            get_related_cache(self.context, queryset.model)
+        )
+        if missing:
+            raise serializers.ValidationError([
+                child.error_messages['does_not_exist'].format(pk_value=pk)
+                for pk in missing
+            ])
+        return objects
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Первичный ключ, проверяемый без отдельного запроса к базе.
+
+    Сам ключ только приводится к типу, а существование объектов
+    проверяет список целиком: BulkManyRelatedField или сериализатор
+    списка, в котором лежит поле.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_shopping_list_txt(items):
+    separator = ''
+    for name, unit, amount in items:
+        yield f'{separator}{name} ({unit}) — {amount}'
+        separator = '\n'
+
+
+def render_shopping_list_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow(item)
+
+
+def render_shopping_list_json(items):
+    separator = '['
+    for name, unit, amount in items:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain', render_shopping_list_txt),
+    'csv': ('text/csv', render_shopping_list_csv),
+    'json': ('application/json', render_shopping_list_json),
+}
 
 
 class ShortLink:
+    """Короткая ссылка рецепта: его id в base62.
+
+    Код однозначно восстанавливается в id без обращения к базе. Старые
+    случайные коды имеют длину SHORT_LINK_MAX_POSTFIX, а base62-коды
+    короче, поэтому они не пересекаются.
+    """
+
+    alphabet = SHORT_LINK_ALPHABET
+    base = len(SHORT_LINK_ALPHABET)
+
+    def create_short_link(self, recipe_id):
+        code = ''
+        while True:
+            recipe_id, digit = divmod(recipe_id, self.base)
+            code = self.alphabet[digit] + code
+            if not recipe_id:
+                return code
+
+    def parse_short_link(self, code):
+        """Возвращает id рецепта или None, если код не в base62-формате."""
+        if (
+            not code or len(code) >= SHORT_LINK_MAX_POSTFIX
+            or code[0] == self.alphabet[0] and len(code) > 1
+        ):
+            return None
+        recipe_id = 0
+        for char in code:
+            digit = self.alphabet.find(char)
+            if digit == -1:
+                return None
+            recipe_id = recipe_id * self.base + digit
+        return recipe_id
+
+
+class CursorPagination(pagination.BasePagination):
+    """Keyset-пагинация по паре (поле сортировки, id).
+
+    Страница выбирается условием по последней записи предыдущей страницы,
+    поэтому не нужны ни COUNT, ни OFFSET.
+    """
+
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [
+            self.get_field(queryset, name.lstrip('-'))
+            for name in self.ordering
+        ]
+        descending = self.ordering[0].startswith('-')
+        position, reverse = self.decode_cursor(request)
+        forward = descending == reverse
+        queryset = queryset.order_by(*(
+            field.name if forward else f'-{field.name}'
+            for field in self.fields
+        ))
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(
+                position, 'gt' if forward else 'lt'
+            ))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
 
-    def create_short_link(self, length):
-        return str(uuid.uuid4()).replace('-', '')[:length]
+    def get_field(self, queryset, name):
+        """Поле модели или аннотация, по которой идёт сортировка."""
+        if name in queryset.query.annotations:
+            field = copy(queryset.query.annotations[name].output_field)
+            field.set_attributes_from_name(name)
+            return field
+        return queryset.model._meta.get_field(name)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_position_filter(self, position, lookup):
+        (first, second), (first_value, second_value) = self.fields, position
+        return (
+            Q(**{f'{first.name}__{lookup}': first_value})
+            | Q(**{
+                first.name: first_value,
+                f'{second.name}__{lookup}': second_value
+            })
+        )
+
+    def get_position(self, item):
+        return [
+            str(item[field.attname] if isinstance(item, dict)
+                else getattr(item, field.attname))
+            for field in self.fields
+        ]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position = [
+                field.to_python(value)
+                for field, value in zip(self.fields, cursor['p'])
+            ]
+            reverse = bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.fields) or None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, item, reverse=False):
+        cursor = {'p': self.get_position(item)}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode())
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class FeedPagination(CursorPagination):
+    """Keyset-пагинация ленты подписок только вперёд.
+
+    Страница берётся из read_feed, а не из кверисета: лента сливается
+    из двух источников, поэтому ссылки назад нет.
+    """
+
+    def __init__(self):
+        super().__init__(('-pub_date', '-id'))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            raise NotFound(self.invalid_cursor_message)
+        keys = read_feed(request.user, position, self.page_size + 1)
+        self.has_next = len(keys) > self.page_size
+        self.has_previous = False
+        recipes = queryset.in_bulk([pk for _, pk in keys[:self.page_size]])
+        self.page = [
+            recipes[pk] for _, pk in keys[:self.page_size] if pk in recipes
+        ]
+        return self.page
 
 
 class Pagination(pagination.PageNumberPagination):
-    """Класс для пагинации."""
+    """Класс для пагинации.
+
+    По умолчанию постраничная, keyset-режим включается параметром
+    ``pagination=cursor``, наличием курсора в запросе или настройкой
+    ``CURSOR_PAGINATION``.
+    """
 
     page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        mode = request.query_params.get(self.mode_query_param)
+        if mode:
+            return mode == 'cursor'
+        return (
+            CursorPagination.cursor_query_param in request.query_params
+            or settings.CURSOR_PAGINATION
+        )
+
+    def get_cursor_ordering(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        first = ordering[0]
+        return (first, '-id' if first.startswith('-') else 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_cursor(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_paginator = CursorPagination(
+            self.get_cursor_ordering(queryset)
+        )
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,57 @@
+import bisect
+
+from api.cache import VersionedState
+from recipes.models import Ingredient
+from recipes.search import normalize
+
+SEPARATOR = '\n'
+
+
+class IngredientIndex(VersionedState):
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Строится лениво при первом поиске и перестраивается, когда меняется
+    версия данных ингредиентов, поэтому поиск не обращается к базе.
+    """
+
+    version_name = 'ingredient'
+
+    def build(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (normalize(item['name']), item['id'])
+        )
+        keys = [normalize(item['name']) for item in items]
+        starts = []
+        position = 0
+        for key in keys:
+            starts.append(position)
+            position += len(key) + len(SEPARATOR)
+        return keys, SEPARATOR.join(keys), starts, items
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        keys, text, starts, items = self.get_state()
+        query = normalize(query)
+        found = []
+        index = bisect.bisect_left(keys, query)
+        while (
+            index < len(keys) and keys[index].startswith(query)
+            and (limit is None or len(found) < limit)
+        ):
+            found.append(items[index])
+            index += 1
+        if not query or SEPARATOR in query:
+            return found
+        position = text.find(query)
+        while position != -1 and (limit is None or len(found) < limit):
+            index = bisect.bisect_right(starts, position) - 1
+            if position != starts[index]:
+                found.append(items[index])
+            if index + 1 == len(starts):
+                break
+            position = text.find(query, starts[index + 1])
+        return found
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,53 @@
+from io import BytesIO
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+UNICODE_LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson.
+
+    Выдаёт те же байты, что и стандартный JSONRenderer, а во всех случаях,
+    где orjson этого не гарантирует, отдаёт работу стандартному рендереру.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if any(separator in ret for separator in UNICODE_LINE_SEPARATORS):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """JSON-парсер на orjson с откатом на стандартный."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(BytesIO(body), media_type, parser_context)
@@ -1,11 +1,16 @@
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
-from api.helpers import Base64ImageField
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from api.helpers import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                         ImageVariantsField, get_file_url, get_image_variants,
+                         get_related_cache, resolve_pks)
+from recipes import shopping_list
+from recipes.bulk import create_recipes
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.purge import raw_delete
 from user.constants import MAX_USER_NAME_LENGTH, MIN_PASSWORD_LENGTH
-from user.models import Follow, User
+from user.models import User
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -15,6 +20,7 @@ class UserSerializer(serializers.ModelSerializer):
         method_name='get_is_followed'
     )
     avatar = Base64ImageField()
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
@@ -25,10 +31,13 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_variants',
             'is_subscribed'
         )
 
     def get_is_followed(self, following):
+        if hasattr(following, 'is_subscribed'):
+            return following.is_subscribed
         user = self.context.get('request').user
         return user.is_authenticated and user.following.filter(
             following=following
@@ -51,10 +60,31 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class CreateRecipeIngredientListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта, проверяемый одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients, missing = resolve_pks(
+            Ingredient.objects.all(), [item['ingredient'] for item in items],
+            get_related_cache(self.context, Ingredient)
+        )
+        if missing:
+            message = self.child.fields['id'].error_messages['does_not_exist']
+            raise serializers.ValidationError([
+                {'id': [message.format(pk_value=item['ingredient'])]}
+                if ingredient is None else {}
+                for item, ingredient in zip(items, ingredients)
+            ])
+        for item, ingredient in zip(items, ingredients):
+            item['ingredient'] = ingredient
+        return items
+
+
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор создания связи Рецепт/Ингридиент."""
 
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         source='ingredient'
     )
@@ -62,6 +92,7 @@ class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = CreateRecipeIngredientListSerializer
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -95,22 +126,139 @@ class GetRecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='get_is_in_shopping_cart'
     )
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
-        exclude = ['short_link', 'pub_date']
+        exclude = ['short_link', 'pub_date', 'favorites_count']
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def get_is_in_favorite(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.user_favorite.filter(recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.cart_recipes.filter(recipe=obj).exists())
 
 
+FLAT_RECIPE_FIELDS = (
+    'id', 'name', 'text', 'image', 'cooking_time', 'pub_date',
+    'is_favorited', 'is_in_shopping_cart', 'author_is_subscribed',
+    'author_id', 'author__username', 'author__email', 'author__first_name',
+    'author__last_name', 'author__avatar',
+)
+
+
+def build_flat_recipes(rows, request):
+    """Собирает представление GetRecipeSerializer из строк values()."""
+    recipe_ids = [row['id'] for row in rows]
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    for item in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'amount',
+        'ingredient__measurement_unit', 'ingredient__name'
+    ):
+        ingredients[item[0]].append({
+            'id': item[1],
+            'amount': item[2],
+            'measurement_unit': item[3],
+            'name': item[4],
+        })
+    tags = {recipe_id: [] for recipe_id in recipe_ids}
+    for item in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by(*(f'tag__{field}' for field in Tag._meta.ordering)).values_list(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__slug'
+    ):
+        tags[item[0]].append({
+            'id': item[1],
+            'name': item[2],
+            'slug': item[3],
+        })
+    image_storage = Recipe._meta.get_field('image').storage
+    avatar_storage = User._meta.get_field('avatar').storage
+    return [
+        {
+            'id': row['id'],
+            'ingredients': ingredients[row['id']],
+            'tags': tags[row['id']],
+            'author': {
+                'id': row['author_id'],
+                'username': row['author__username'],
+                'email': row['author__email'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'avatar': get_file_url(
+                    avatar_storage, row['author__avatar'], request
+                ),
+                'avatar_variants': get_image_variants(
+                    avatar_storage, row['author__avatar'], request
+                ),
+                'is_subscribed': row['author_is_subscribed'],
+            },
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'image_variants': get_image_variants(
+                image_storage, row['image'], request
+            ),
+            'name': row['name'],
+            'text': row['text'],
+            'image': get_file_url(image_storage, row['image'], request),
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    ]
+
+
+class FlatRecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов, собранный одним проходом по странице."""
+
+    def to_representation(self, data):
+        return build_flat_recipes(list(data), self.context.get('request'))
+
+
+class FlatRecipeSerializer(serializers.BaseSerializer):
+    """Сериализатор чтения рецепта из строки values() без вложенных полей.
+
+    Отдаёт тот же результат, что и GetRecipeSerializer, но строит его
+    напрямую из словарей, без экземпляров моделей и сериализаторов.
+    """
+
+    class Meta:
+        list_serializer_class = FlatRecipeListSerializer
+
+    def to_representation(self, instance):
+        return build_flat_recipes([instance], self.context.get('request'))[0]
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Создание многих рецептов несколькими INSERT на все сразу."""
+
+    def create(self, validated_data):
+        recipes, ingredients, tags = [], [], []
+        for item in validated_data:
+            item = dict(item)
+            ingredients.append([
+                (ingredient['ingredient'].id, ingredient['amount'])
+                for ingredient in item.pop('recipe_ingredients')
+            ])
+            tags.append([tag.id for tag in item.pop('tags')])
+            recipes.append(Recipe(**item))
+        return create_recipes(recipes, ingredients, tags)
+
+
 class RecipesSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
 
@@ -123,13 +271,14 @@ class RecipesSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredients'
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
 
     class Meta:
         model = Recipe
         fields = '__all__'
+        list_serializer_class = RecipeListSerializer
 
     def validate(self, attrs):
         tags = attrs.get('tags')
@@ -155,10 +304,12 @@ class RecipesSerializer(serializers.ModelSerializer):
             )
         return attrs
 
+    @transaction.atomic
     def create(self, value):
         recipe, value = self.add_or_update_recipe_ingredients_tags(value)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, value):
         recipe, value = self.add_or_update_recipe_ingredients_tags(
             value, recipe
@@ -166,23 +317,54 @@ class RecipesSerializer(serializers.ModelSerializer):
         return super().update(recipe, value)
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'recipe_ingredients__ingredient', 'tags'
+        )
         return GetRecipeSerializer(
             instance,
             context={'request': self.context.get('request')}
         ).data
 
     def add_or_update_recipe_ingredients_tags(self, value, recipe=None):
+        """Сохраняет ингредиенты и тэги, меняя только то, что изменилось."""
         ingredients = value.pop('recipe_ingredients')
         tags = value.pop('tags')
+        current = {}
         if not recipe:
             recipe = Recipe.objects.create(**value)
-        recipe.recipe_ingredients.all().delete()
-        recipe.tags.clear()
-        recipe_ingredients = [
-            RecipeIngredient(recipe=recipe, **ingredient)
-            for ingredient in ingredients
-        ]
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        else:
+            current = {
+                ingredient_id: (pk, amount)
+                for pk, ingredient_id, amount in
+                recipe.recipe_ingredients.values_list(
+                    'pk', 'ingredient_id', 'amount'
+                )
+            }
+        amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        created, changed, deltas = [], [], {}
+        for ingredient_id, amount in amounts.items():
+            if ingredient_id not in current:
+                created.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+                deltas[ingredient_id] = amount
+                continue
+            pk, previous = current[ingredient_id]
+            if amount != previous:
+                changed.append(RecipeIngredient(pk=pk, amount=amount))
+                deltas[ingredient_id] = amount - previous
+        removed = []
+        for ingredient_id, (pk, previous) in current.items():
+            if ingredient_id not in amounts:
+                removed.append(pk)
+                deltas[ingredient_id] = -previous
+        if removed:
+            raw_delete(RecipeIngredient.objects.filter(pk__in=removed))
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(created)
+        shopping_list.change_recipe(recipe.id, deltas)
         recipe.tags.set(tags)
         return recipe, value
 
@@ -259,100 +441,15 @@ class GetFollowSerializer(UserSerializer):
         ).data
 
     def get_recipes_count(self, user):
-        return user.recipes.count()
-
-    def get_is_subscribed(self, user):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.following.filter(following=user).exists())
-
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = instance.recipes.all()
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
-        representation['recipes'] = ShortRecipeSerializer(
-            recipes, context={'request': request}, many=True
-        ).data
-        representation['recipes_count'] = recipes.count()
-        return representation
-
-
-class FollowSerializer(serializers.ModelSerializer):
-    """Сериализатор для создания подписок."""
-
-    class Meta:
-        model = Follow
-        fields = ('user', 'following')
-
-    def validate(self, attrs):
-        follower = attrs['user']
-        following = attrs['following']
-
-        if follower == following:
-            raise serializers.ValidationError(
-                'Попытка подписаться на самого себя'
-            )
-        is_subscription_exists = Follow.objects.filter(
-            user=follower,
-            following=following
-        ).exists()
-        if is_subscription_exists:
-            raise serializers.ValidationError('Подписка уже есть')
-        return attrs
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return GetFollowSerializer(
-            instance.following, context={'request': request}
-        ).data
+        return user.recipes_count
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для получения короткой версии рецепта."""
 
     image = Base64ImageField()
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-
-
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализатор для корзины."""
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
-
-    def to_representation(self, instance):
-        return ShortRecipeSerializer(
-            instance.recipe
-        ).data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для избранного."""
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
-
-    def to_representation(self, instance):
-        return ShortRecipeSerializer(
-            instance.recipe
-        ).data
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
@@ -0,0 +1,48 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import bump_version
+from recipes.bulk import bulk_changed
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+def bump_after_commit(name):
+    """Меняет версию только после коммита, когда новые данные видны.
+
+    Иначе ответ, прочитанный до коммита, попал бы в кеш под новой
+    версией и жил бы до следующей записи.
+    """
+    transaction.on_commit(partial(bump_version, name))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(bulk_changed, sender=Recipe)
+def recipe_changed(**kwargs):
+    bump_after_commit('recipe')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(bulk_changed, sender=Tag)
+def tag_changed(**kwargs):
+    bump_after_commit('tag')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(bulk_changed, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_after_commit('ingredient')
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(created=False, update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_after_commit('user')
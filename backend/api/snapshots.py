@@ -0,0 +1,68 @@
+import gzip
+import hashlib
+import time
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from api.cache import VersionedState
+from api.renderers import FastJSONRenderer
+
+
+class Snapshot:
+    """Отрендеренный ответ справочника для одной версии данных.
+
+    У сжатого и несжатого представлений разные ETag: это разные байты,
+    и кеши не должны отдавать одно вместо другого.
+    """
+
+    def __init__(self, body, last_modified=None):
+        self.body = body
+        self.gzipped = gzip.compress(body, mtime=0)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.last_modified = last_modified or int(time.time())
+
+
+class SnapshotStore(VersionedState):
+    """Хранит снимок ответа и пересобирает его при смене версии данных."""
+
+    def __init__(self, version_name, queryset, serializer_class):
+        super().__init__()
+        self.version_name = version_name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+
+    def render(self):
+        data = self.serializer_class(self.queryset.all(), many=True).data
+        return FastJSONRenderer().render(data)
+
+    def build(self):
+        body = self.render()
+        previous = self.state and self.state[2]
+        if previous and previous.body == body:
+            return Snapshot(body, previous.last_modified)
+        return Snapshot(body)
+
+    def serve(self, request):
+        """Ответ со снимком, 304 при совпадении ETag/Last-Modified."""
+        snapshot = self.get_state()
+        accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = snapshot.gzip_etag if accepts_gzip else snapshot.etag
+        response = HttpResponse(
+            snapshot.gzipped if accepts_gzip else snapshot.body,
+            content_type='application/json'
+        )
+        if accepts_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(snapshot.last_modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=snapshot.last_modified,
+            response=response,
+        )
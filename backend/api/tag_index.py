@@ -0,0 +1,26 @@
+from api.cache import VersionedState
+from recipes.models import Tag
+
+
+class TagIndex(VersionedState):
+    """Соответствие слагов тегов их id в памяти процесса.
+
+    Тегов немного, поэтому словарь строится целиком и перестраивается,
+    только когда меняется версия данных тегов.
+    """
+
+    version_name = 'tag'
+
+    def build(self):
+        return dict(Tag.objects.values_list('slug', 'id'))
+
+    def resolve(self, slugs):
+        """Возвращает id известных слагов и список неизвестных."""
+        ids = self.get_state()
+        return (
+            {ids[slug] for slug in slugs if slug in ids},
+            [slug for slug in slugs if slug not in ids]
+        )
+
+
+tag_index = TagIndex()
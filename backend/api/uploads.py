@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+
+from recipes.constants import UPLOAD_CHUNK_SIZE, UPLOAD_EXPIRY, UPLOAD_MAX_SIZE
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Ошибка загрузки файла по частям."""
+
+
+class UploadedPart(File):
+    """Файл загрузки, лежащий на диске.
+
+    Хранилище может переместить его на место картинки. Тогда загрузка
+    использована, и её описание удаляется вместе с объектом файла.
+    """
+
+    def __init__(self, file, name, session):
+        super().__init__(file, name)
+        self.session = session
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def __del__(self):
+        self.close()
+        if not os.path.exists(self.file.name):
+            self.session.forget()
+
+
+class UploadSession:
+    """Загрузка файла по частям во временный каталог пользователя.
+
+    Состояние хранится рядом с данными: ``<id>.part`` содержит принятые
+    байты, ``<id>.json`` — ожидаемый размер и имя файла.
+    """
+
+    def __init__(self, user, upload_id):
+        if not UPLOAD_ID.match(upload_id):
+            raise UploadError('Загрузка не найдена')
+        self.id = upload_id
+        self.directory = os.path.join(settings.UPLOADS_ROOT, str(user.pk))
+        self.path = os.path.join(self.directory, f'{upload_id}.part')
+        self.meta_path = os.path.join(self.directory, f'{upload_id}.json')
+
+    @classmethod
+    def create(cls, user, size=None, name=None):
+        if size is not None and not 0 < size <= UPLOAD_MAX_SIZE:
+            raise UploadError(
+                f'Размер файла должен быть от 1 до {UPLOAD_MAX_SIZE} байт'
+            )
+        session = cls(user, uuid.uuid4().hex)
+        os.makedirs(session.directory, exist_ok=True)
+        session.remove_expired()
+        with open(session.meta_path, 'w') as meta:
+            json.dump(
+                {'size': size, 'name': name or f'{session.id}.jpg'}, meta
+            )
+        open(session.path, 'wb').close()
+        return session
+
+    @property
+    def meta(self):
+        try:
+            with open(self.meta_path) as meta:
+                return json.load(meta)
+        except FileNotFoundError:
+            raise UploadError('Загрузка не найдена')
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            self.forget()
+            raise UploadError('Загрузка не найдена')
+
+    @property
+    def complete(self):
+        size = self.meta['size']
+        return size is not None and self.offset == size
+
+    def status(self):
+        return {
+            'id': self.id,
+            'size': self.meta['size'],
+            'offset': self.offset,
+            'complete': self.complete,
+        }
+
+    def append(self, stream, content_range):
+        """Дописывает часть файла, описанную заголовком Content-Range."""
+        match = CONTENT_RANGE.match(content_range or '')
+        if not match:
+            raise UploadError('Нужен заголовок Content-Range: bytes a-b/n')
+        start, end, total = match.groups()
+        start, end = int(start), int(end)
+        size = self.meta['size']
+        if total != '*':
+            total = int(total)
+            if size is not None and total != size:
+                raise UploadError('Размер файла не совпадает с заявленным')
+            size = total
+        if end < start or size is not None and end >= size:
+            raise UploadError('Неверный диапазон')
+        if end >= UPLOAD_MAX_SIZE:
+            raise UploadError(f'Файл больше {UPLOAD_MAX_SIZE} байт')
+        if start != self.offset:
+            raise UploadError(f'Ожидается часть с позиции {self.offset}')
+        remaining = end - start + 1
+        with open(self.path, 'ab') as part:
+            while remaining:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                part.write(chunk)
+                remaining -= len(chunk)
+            if remaining:
+                part.truncate(start)
+                raise UploadError('Тело запроса короче диапазона')
+        self.save_size(size)
+
+    def save_file(self, uploaded):
+        """Сохраняет целиком файл, принятый через multipart."""
+        if uploaded.size > UPLOAD_MAX_SIZE:
+            raise UploadError(f'Файл больше {UPLOAD_MAX_SIZE} байт')
+        if hasattr(uploaded, 'temporary_file_path'):
+            uploaded.close()
+            file_move_safe(
+                uploaded.temporary_file_path(), self.path,
+                allow_overwrite=True
+            )
+        else:
+            with open(self.path, 'wb') as part:
+                for chunk in uploaded.chunks(UPLOAD_CHUNK_SIZE):
+                    part.write(chunk)
+        self.save_size(uploaded.size)
+
+    def save_size(self, size):
+        meta = self.meta
+        if meta['size'] != size:
+            meta['size'] = size
+            with open(self.meta_path, 'w') as meta_file:
+                json.dump(meta, meta_file)
+
+    def open(self):
+        """Файл завершённой загрузки для поля модели.
+
+        Хранилище перемещает такой файл на место, не читая его в память.
+        """
+        if not self.complete:
+            raise UploadError('Загрузка ещё не завершена')
+        name = self.meta['name']
+        try:
+            return UploadedPart(open(self.path, 'rb'), name, self)
+        except FileNotFoundError:
+            self.forget()
+            raise UploadError('Загрузка не найдена')
+
+    def forget(self):
+        """Удаляет описание загрузки, файл которой уже забрали."""
+        try:
+            os.remove(self.meta_path)
+        except FileNotFoundError:
+            pass
+
+    def remove_expired(self):
+        expired = time.time() - UPLOAD_EXPIRY
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
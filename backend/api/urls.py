@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipesViewSet, TagViewSet, UserViewSet
+from .views import (ChangeViewSet, IngredientViewSet, RecipesViewSet,
+                    TagViewSet, UploadViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -10,6 +11,8 @@ router.register('recipes', RecipesViewSet, 'recipe')
 router.register('users', UserViewSet, 'user')
 router.register('tags', TagViewSet, 'tag'),
 router.register('ingredients', IngredientViewSet, 'ingredient')
+router.register('uploads', UploadViewSet, 'upload')
+router.register('changes', ChangeViewSet, 'change')
 
 
 api_urls = [
@@ -1,65 +1,181 @@
+from functools import lru_cache
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Prefetch, Value,
+                              prefetch_related_objects)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from api.cache import AnonymousCacheMixin, get_versions
 from api.filters import IngredientFilter, RecipeFilter
-from api.helpers import Pagination, ShortLink
+from api.helpers import (SHOPPING_LIST_FORMATS, FeedPagination, Pagination,
+                         ShortLink, get_related_cache, resolve_pks)
+from api.ingredient_index import ingredient_index
 from api.permissions import OwnerOrReadOnly
-from api.serializers import (CreateUserSerializer, FavoriteSerializer,
-                             FollowSerializer, GetFollowSerializer,
+from api.renderers import FastJSONParser
+from api.serializers import (FLAT_RECIPE_FIELDS, CreateUserSerializer,
+                             FlatRecipeSerializer, GetFollowSerializer,
                              IngredientSerializer, RecipesSerializer,
-                             ShoppingCartSerializer, TagSerializer,
+                             ShortRecipeSerializer, TagSerializer,
                              UserAvatarSerializer, UserSerializer)
-from recipes.constants import SHORT_LINK_MAX_POSTFIX, URL
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from api.snapshots import SnapshotStore
+from api.uploads import UploadError, UploadSession
+from recipes import changes
+from recipes.constants import (CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE,
+                               RECIPE_BULK_MAX_SIZE, SHORT_LINK_CACHE_SIZE,
+                               SHORT_LINK_MAX_AGE, URL)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.relations import (add_many, clear, delete_first, insert_first,
+                               remove_many)
 from user.models import Follow
 
 User = get_user_model()
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     """Вьюсет рецепта и всего что с ним связано."""
 
     queryset = Recipe.objects.all()
+    cache_versions = ('recipe', 'tag', 'ingredient', 'user')
     serializer_class = RecipesSerializer
     pagination_class = Pagination
     permission_classes = [IsAuthenticatedOrReadOnly, OwnerOrReadOnly]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def use_flat_read_model(self):
+        return (
+            settings.FLAT_RECIPE_SERIALIZATION
+            and self.action in ('list', 'retrieve')
+        )
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.use_flat_read_model():
+            return queryset.values(*FLAT_RECIPE_FIELDS)
+        return queryset.with_related()
+
+    def get_serializer_class(self):
+        if self.use_flat_read_model():
+            return FlatRecipeSerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        methods=['POST'],
+        url_path='bulk',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_create(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Ожидается непустой список рецептов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > RECIPE_BULK_MAX_SIZE:
+            return Response(
+                {'error': f'Не больше {RECIPE_BULK_MAX_SIZE} рецептов '
+                          'за запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        context = self.get_serializer_context()
+        context['related_objects'] = {}
+        self.preload_related(items, context)
+        serializers = [
+            RecipesSerializer(data=item, context=context) for item in items
+        ]
+        valid = [serializer.is_valid() for serializer in serializers]
+        atomic = request.query_params.get('atomic', '').lower() in (
+            '1', 'true'
+        )
+        if not any(valid) or atomic and not all(valid):
+            return Response(
+                [{'errors': serializer.errors} for serializer in serializers],
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipes = iter(RecipesSerializer(many=True, context=context).create([
+            {**serializer.validated_data, 'author': request.user}
+            for serializer, is_valid in zip(serializers, valid) if is_valid
+        ]))
+        return Response(
+            [
+                {'id': next(recipes).id} if is_valid
+                else {'errors': serializer.errors}
+                for serializer, is_valid in zip(serializers, valid)
+            ],
+            status=(
+                status.HTTP_201_CREATED if all(valid)
+                else status.HTTP_207_MULTI_STATUS
+            )
+        )
+
+    @action(
+        methods=['GET'],
+        url_path='feed',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(self.get_queryset(), request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def preload_related(self, items, context):
+        """Загружает тэги и ингредиенты всех рецептов двумя запросами."""
+        tag_ids, ingredient_ids = set(), set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            tags, ingredients = item.get('tags'), item.get('ingredients')
+            if isinstance(tags, list):
+                tag_ids.update(pk for pk in tags if type(pk) is int)
+            if isinstance(ingredients, list):
+                ingredient_ids.update(
+                    ingredient.get('id') for ingredient in ingredients
+                    if isinstance(ingredient, dict)
+                    and type(ingredient.get('id')) is int
+                )
+        for model, pks in ((Tag, tag_ids), (Ingredient, ingredient_ids)):
+            resolve_pks(
+                model.objects.all(), pks, get_related_cache(context, model)
+            )
+
     @action(
         methods=['GET'],
         url_path='get-link',
         detail=True
     )
     def get_short_link(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if recipe.short_link:
-            return Response(
-                {"short-link": URL + recipe.short_link},
-                status=status.HTTP_200_OK
-            )
-        while True:
-            short_link = ShortLink().create_short_link(SHORT_LINK_MAX_POSTFIX)
-            try_recipe = Recipe.objects.filter(short_link=short_link)
-            if not try_recipe:
-                break
-        recipe.short_link = short_link
-        recipe.save()
-        short_link = URL + short_link
-        return Response({"short-link": short_link}, status=status.HTTP_200_OK)
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'short_link'), id=pk
+        )
+        if not recipe.short_link:
+            recipe.short_link = ShortLink().create_short_link(recipe.id)
+            Recipe.objects.filter(
+                pk=recipe.pk, short_link__isnull=True
+            ).update(short_link=recipe.short_link)
+        return Response(
+            {"short-link": URL + recipe.short_link},
+            status=status.HTTP_200_OK
+        )
 
     @action(
         methods=['POST', 'DELETE'],
@@ -69,7 +185,6 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     def add_to_favorite(self, request, pk):
         return self.add_recipe_to_favorite_or_shopping_cart(
-            serializer=FavoriteSerializer,
             model=Favorite,
             id=pk,
             request=request
@@ -83,12 +198,47 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     def add_to_shopping_cart(self, request, pk):
         return self.add_recipe_to_favorite_or_shopping_cart(
-            serializer=ShoppingCartSerializer,
             model=ShoppingCart,
             id=pk,
             request=request
         )
 
+    @action(
+        methods=['POST', 'DELETE'],
+        url_path='favorite/bulk',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        return self.change_many(Favorite, request)
+
+    @action(
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart/bulk',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_shopping_cart(self, request):
+        return self.change_many(ShoppingCart, request)
+
+    @action(
+        methods=['DELETE'],
+        url_path='favorite/clear',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def clear_favorite(self, request):
+        return self.clear_all(Favorite, request)
+
+    @action(
+        methods=['DELETE'],
+        url_path='shopping_cart/clear',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def clear_shopping_cart(self, request):
+        return self.clear_all(ShoppingCart, request)
+
     @action(
         methods=['GET'],
         url_path='download_shopping_cart',
@@ -96,57 +246,92 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        shopping_cart_ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__cart_recipes__user=request.user
-            ).values(
-                'ingredient__name',
-                'ingredient__measurement_unit'
-            ).annotate(total_amount=Sum('amount')).order_by('ingredient__name')
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'error': 'Неизвестный формат списка покупок'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        etag = (
+            f'"{request.user.id}-{request.user.shopping_cart_version}'
+            f'-{file_type}"'
         )
-        shopping_list = self.prepsre_recipes_to_dl(shopping_cart_ingredients)
-        return self.dl_shopping_list(shopping_list)
-
-    def prepsre_recipes_to_dl(self, ingredients):
-        shopping_list = []
-        for item in ingredients:
-            name = item['ingredient__name']
-            unit = item['ingredient__measurement_unit']
-            total_amount = item['total_amount']
-            shopping_list.append(f"{name} ({unit}) — {total_amount}")
-        shopping_list_text = "\n".join(shopping_list)
-        return shopping_list_text
-
-    def dl_shopping_list(self, shopping_list_text):
-        response = HttpResponse(shopping_list_text, content_type='text/plain')
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_list.txt"'
-
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by('ingredient__name').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).iterator()
+        content_type, render = SHOPPING_LIST_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            render(items), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"'
+        )
+        response['ETag'] = etag
         return response
 
-    def add_recipe_to_favorite_or_shopping_cart(
-            self, serializer, model, id, request,
-    ):
-        recipe = get_object_or_404(Recipe, id=id)
+    def add_recipe_to_favorite_or_shopping_cart(self, model, id, request):
+        """Добавление и удаление одним запросом на запись.
+
+        Повтор отсекает уникальное ограничение базы, а отсутствие строки
+        видно по числу удалённых, поэтому двойной клик не даёт 500.
+        """
+        if not str(id).isdigit():
+            raise Http404
         if request.method == 'POST':
-            serializer = serializer(data={
-                'recipe': recipe.id,
-                'user': request.user.id,
-                'context': {'request': request}
-            })
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        recipe = model.objects.filter(user=request.user, recipe=recipe)
-        if not recipe:
+            if insert_first(model, user=request.user, recipe_id=id) is None:
+                if not Recipe.objects.filter(pk=id).exists():
+                    raise Http404
+                return Response(
+                    {'error': 'Рецепт уже добавлен'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(
+                ShortRecipeSerializer(Recipe.objects.get(pk=id)).data,
+                status=status.HTTP_201_CREATED
+            )
+        if not delete_first(model, user=request.user, recipe_id=id):
             return Response(
                 {'error': 'Рецепт не найден'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        recipe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def change_many(self, model, request):
+        """POST добавляет, DELETE убирает рецепты из списка ids."""
+        ids = request.data.get('ids') if isinstance(
+            request.data, dict
+        ) else None
+        if (
+            not isinstance(ids, list) or not ids
+            or any(type(pk) is not int for pk in ids)
+        ):
+            return Response(
+                {'error': 'Ожидается непустой список id рецептов в ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ids) > RECIPE_BULK_MAX_SIZE:
+            return Response(
+                {'error': f'Не больше {RECIPE_BULK_MAX_SIZE} рецептов '
+                          'за запрос'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        change = add_many if request.method == 'POST' else remove_many
+        results = change(model, request.user, ids)
+        return Response({'results': [
+            {'id': pk, 'status': result} for pk, result in results.items()
+        ]})
+
+    def clear_all(self, model, request):
+        return Response({'results': [
+            {'id': pk, 'status': 'removed'}
+            for pk in clear(model, request.user)
+        ]})
+
 
 class UserViewSet(DjoserUserViewSet):
     """Вьюсет пользователя."""
@@ -186,11 +371,13 @@ class UserViewSet(DjoserUserViewSet):
             serializer = UserAvatarSerializer(
                 user,
                 data=request.data,
+                context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
-        request.user.avatar.delete()
+        user.avatar.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -200,24 +387,38 @@ class UserViewSet(DjoserUserViewSet):
         detail=True,
     )
     def subscribe(self, request, id):
-        user = get_object_or_404(User, username=request.user.username)
-        following = get_object_or_404(User, pk=id)
+        if not str(id).isdigit():
+            raise Http404
         if request.method == 'POST':
-            serializer = FollowSerializer(
-                data={'user': user.id, 'following': following.id},
-                context={'request': request}
+            if int(id) == request.user.pk:
+                return Response(
+                    {'error': 'Попытка подписаться на самого себя'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if insert_first(
+                Follow, user=request.user, following_id=id
+            ) is None:
+                if not User.objects.filter(pk=id).exists():
+                    raise Http404
+                return Response(
+                    {'error': 'Подписка уже есть'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            following = User.objects.annotate(
+                is_subscribed=Value(True, BooleanField())
+            ).get(pk=id)
+            return Response(
+                GetFollowSerializer(
+                    following, context={'request': request}
+                ).data,
+                status=status.HTTP_201_CREATED
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        follow = Follow.objects.filter(
-            user=user.id,
-            following=following.id
-        )
-        if follow:
-            follow.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        if not delete_first(Follow, user=request.user, following_id=id):
+            return Response(
+                {'error': 'Подписки нет'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         methods=['GET'],
@@ -226,13 +427,23 @@ class UserViewSet(DjoserUserViewSet):
         detail=False,
     )
     def get_subscribtions(self, request):
-        user = get_object_or_404(User, username=request.user.username)
         limit = request.query_params.get('limit')
-        following_users = User.objects.filter(following__user=user)
-        if limit:
-            following_users = following_users[:int(limit)]
+        following_users = User.objects.filter(
+            following__user=request.user
+        ).annotate(is_subscribed=Value(True, BooleanField()))
         paginator = Pagination()
+        if limit and not paginator.use_cursor(request):
+            following_users = following_users[:int(limit)]
         result_page = paginator.paginate_queryset(following_users, request)
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.first_per_author(
+                [author.pk for author in result_page], int(recipes_limit)
+            )
+        prefetch_related_objects(
+            result_page, Prefetch('recipes', queryset=recipes)
+        )
         serializer = GetFollowSerializer(
             result_page,
             many=True,
@@ -241,12 +452,135 @@ class UserViewSet(DjoserUserViewSet):
         return paginator.get_paginated_response(serializer.data)
 
 
+class ChangeViewSet(viewsets.ViewSet):
+    """Журнал изменений для инкрементальной синхронизации клиента.
+
+    Без since возвращает курсор на конец журнала: после него клиент
+    загружает списки целиком, а дальше запрашивает изменения с этим
+    курсором. Удаление рецепта означает и его удаление из избранного и
+    корзины. 410 — журнал уже сжат, нужна полная синхронизация.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def list(self, request):
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                'cursor': str(changes.get_head()),
+                'has_more': False,
+                'results': [],
+            })
+        if not since.isdigit():
+            return Response(
+                {'error': 'Неверный курсор'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        since = int(since)
+        if changes.is_expired(since):
+            return Response(
+                {'error': 'Курсор устарел, нужна полная синхронизация'},
+                status=status.HTTP_410_GONE
+            )
+        limit = request.query_params.get('limit', '')
+        limit = int(limit) if limit.isdigit() else 0
+        limit = min(limit or CHANGES_PAGE_SIZE, CHANGES_MAX_PAGE_SIZE)
+        entries = changes.read_changes(request.user, since, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        # Внутри страницы достаточно последнего изменения объекта.
+        latest = {
+            (entry.kind, entry.object_id): entry for entry in entries
+        }
+        return Response({
+            'cursor': str(entries[-1].position if entries else since),
+            'has_more': has_more,
+            'results': [
+                {
+                    'type': entry.kind,
+                    'id': entry.object_id,
+                    'deleted': entry.deleted,
+                }
+                for entry in sorted(
+                    latest.values(), key=lambda entry: entry.position
+                )
+            ],
+        })
+
+
+class UploadViewSet(viewsets.ViewSet):
+    """Вьюсет загрузки картинок файлом или по частям.
+
+    POST с файлом в поле file сохраняет его сразу, POST с размером
+    начинает загрузку по частям, которые отправляются PATCH-запросами
+    с заголовком Content-Range. Готовую загрузку можно передать в поле
+    картинки как ``upload:<id>``.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    parser_classes = (MultiPartParser, FastJSONParser)
+
+    def create(self, request):
+        uploaded = request.FILES.get('file')
+        size = request.data.get('size')
+        try:
+            if uploaded is not None:
+                session = UploadSession.create(request.user)
+                session.save_file(uploaded)
+            elif isinstance(size, int):
+                session = UploadSession.create(request.user, size=size)
+            else:
+                raise UploadError('Нужен файл в поле file или размер size')
+        except UploadError as error:
+            return Response(
+                {'error': str(error)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(session.status(), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk):
+        try:
+            return Response(UploadSession(request.user, pk).status())
+        except UploadError as error:
+            return Response(
+                {'error': str(error)}, status=status.HTTP_404_NOT_FOUND
+            )
+
+    def partial_update(self, request, pk):
+        try:
+            session = UploadSession(request.user, pk)
+            session.status()
+        except UploadError as error:
+            return Response(
+                {'error': str(error)}, status=status.HTTP_404_NOT_FOUND
+            )
+        try:
+            session.append(
+                request.stream, request.META.get('HTTP_CONTENT_RANGE')
+            )
+            return Response(session.status())
+        except UploadError as error:
+            try:
+                details = session.status()
+            except UploadError:
+                details = {}
+            return Response(
+                {'error': str(error), **details},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет тэгов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    snapshot = SnapshotStore('tag', queryset, serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return self.snapshot.serve(request)
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -257,11 +591,42 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    snapshot = SnapshotStore('ingredient', queryset, serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            if request.accepted_renderer.format != 'json':
+                return super().list(request, *args, **kwargs)
+            return self.snapshot.serve(request)
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        return Response(ingredient_index.search(name, limit))
 
 
-def redirect_to_recipe_detail(request, short_link_code):
-    recipe = get_object_or_404(Recipe, short_link=short_link_code)
-    return redirect(
-        'api:recipe-detail',
-        pk=recipe.id
+@lru_cache(maxsize=SHORT_LINK_CACHE_SIZE)
+def resolve_short_link(short_link_code, version):
+    """Адрес рецепта по короткой ссылке, None если рецепта нет.
+
+    version — версия рецептов: после создания или удаления рецепта
+    закешированный ответ перестаёт использоваться.
+    """
+    recipe_id = ShortLink().parse_short_link(short_link_code)
+    recipes = (
+        Recipe.objects.filter(short_link=short_link_code)
+        if recipe_id is None else Recipe.objects.filter(pk=recipe_id)
     )
+    recipe_id = recipes.values_list('id', flat=True).first()
+    if recipe_id is None:
+        return None
+    return reverse('api:recipe-detail', kwargs={'pk': recipe_id})
+
+
+def redirect_to_recipe_detail(request, short_link_code):
+    version, = get_versions('recipe')
+    url = resolve_short_link(short_link_code, version)
+    if url is None:
+        raise Http404
+    response = redirect(url)
+    patch_cache_control(response, public=True, max_age=SHORT_LINK_MAX_AGE)
+    return response
@@ -74,6 +74,37 @@ DATABASES = {
     }
 }
 
+# Кеши должны быть общими для всех процессов, иначе запись в одном
+# воркере не сбросит ответы и индексы в остальных. Поэтому по умолчанию
+# они файловые; кеши в памяти процесса допустимы только при DEBUG
+# (см. проверку api.E001). Версии данных и статистика лежат отдельно
+# от ответов: их ключи без срока жизни не должны вытесняться.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    },
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache_versions')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
+API_CACHE_ALIAS = 'default'
+API_VERSION_CACHE_ALIAS = 'versions'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -94,11 +125,27 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': PAGE_SIZE,
 }
 
+CURSOR_PAGINATION = (
+    os.getenv('CURSOR_PAGINATION', 'False').lower() == 'true'
+)
+FLAT_RECIPE_SERIALIZATION = (
+    os.getenv('FLAT_RECIPE_SERIALIZATION', 'True').lower() == 'true'
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -132,7 +179,14 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+UPLOADS_ROOT = os.getenv('UPLOADS_ROOT', os.path.join(BASE_DIR, 'uploads'))
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# 0 — раскладывать рецепты по лентам синхронно после коммита.
+TIMELINE_WORKERS = int(os.getenv('TIMELINE_WORKERS', 2))
+# Рецепты авторов с большим числом подписчиков читаются при запросе ленты.
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 10_000))
 
-PATH_TO_INGREDIENTS = BASE_DIR / 'data/ingredients.json'
+PATH_TO_INGREDIENTS = BASE_DIR / 'data/ingredients.csv'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
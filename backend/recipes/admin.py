@@ -53,7 +53,7 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='Сколько раз добавили в избранное')
     def get_favorite_count(self, object):
-        return object.user_favorite.count()
+        return object.favorites_count
 
 
 @admin.register(Ingredient)
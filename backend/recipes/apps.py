@@ -5,3 +5,6 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        from recipes import checks, signals  # noqa: F401
@@ -0,0 +1,91 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.dispatch import Signal
+
+from recipes import changes, images, timeline
+from recipes.counters import shift_counters
+from recipes.models import Recipe, RecipeIngredient
+from recipes.storage import change_references
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+# Отправляется после массовых изменений в обход сигналов моделей:
+# sender — модель, pks — ключи изменённых строк или None, если их много.
+# Отправлять через send_bulk_changed, чтобы получатели видели данные.
+bulk_changed = Signal()
+
+
+def send_bulk_changed(sender, pks=None):
+    """Отправляет bulk_changed после коммита текущей транзакции."""
+    transaction.on_commit(partial(bulk_changed.send, sender=sender, pks=pks))
+
+
+def bulk_create_with_ids(model, objects, batch_size=BATCH_SIZE):
+    """bulk_create, после которого у всех объектов заполнен pk.
+
+    Если база не умеет возвращать ключи из многострочного INSERT,
+    строки вставляются по одной, тоже без сигналов и без save().
+    """
+    using = router.db_for_write(model)
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+    opts = model._meta
+    fields = [
+        field for field in opts.local_concrete_fields
+        if field not in opts.db_returning_fields
+    ]
+    for obj in objects:
+        row, = model._base_manager._insert(
+            [obj], fields=fields, using=using,
+            returning_fields=opts.db_returning_fields
+        )
+        for field, value in zip(opts.db_returning_fields, row):
+            setattr(obj, field.attname, value)
+        obj._state.adding = False
+        obj._state.db = using
+    return objects
+
+
+@transaction.atomic
+def create_recipes(recipes, ingredients, tags):
+    """Сохраняет новые рецепты несколькими INSERT на все сразу.
+
+    ingredients и tags идут параллельно recipes: для каждого рецепта
+    список пар (id ингредиента, количество) и список id тэгов.
+    Счётчики, ссылки на картинки и кэш обновляются здесь же,
+    потому что bulk_create не отправляет сигналы.
+    """
+    bulk_create_with_ids(Recipe, recipes)
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for recipe, recipe_ingredients in zip(recipes, ingredients)
+            for ingredient_id, amount in recipe_ingredients
+        ),
+        batch_size=BATCH_SIZE
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, recipe_tags in zip(recipes, tags)
+            for tag_id in recipe_tags
+        ),
+        batch_size=BATCH_SIZE
+    )
+    shift_counters(
+        User, 'recipes_count', [recipe.author_id for recipe in recipes]
+    )
+    change_references([recipe.image.name for recipe in recipes], 1)
+    unique_images = {recipe.image.name: recipe.image for recipe in recipes}
+    for image in unique_images.values():
+        images.schedule_variants(image)
+    timeline.schedule_fan_out(recipe.id for recipe in recipes)
+    changes.record(changes.RECIPE, [recipe.id for recipe in recipes])
+    send_bulk_changed(Recipe, [recipe.id for recipe in recipes])
+    return recipes
@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Min, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from recipes.constants import CHANGE_LOG_LAG
+from recipes.models import ChangeLogEntry, row_number_filter
+
+RECIPE = 'recipe'
+FAVORITE = 'favorite'
+SHOPPING_CART = 'shopping_cart'
+FOLLOW = 'follow'
+# Создаётся миграцией 0013_change_log_position, только в PostgreSQL.
+POSITION_SEQUENCE = 'recipes_changelogentry_position_seq'
+
+
+def record(kind, object_ids, deleted=False):
+    """Пишет в журнал изменения общедоступных объектов."""
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(kind=kind, object_id=object_id, deleted=deleted)
+        for object_id in object_ids
+    )
+    transaction.on_commit(assign_positions)
+
+
+def record_for_users(kind, pairs, deleted=False):
+    """Пишет изменения, видимые только своим пользователям.
+
+    pairs — пары (id пользователя, id объекта).
+    """
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(
+            user_id=user_id, kind=kind, object_id=object_id, deleted=deleted
+        )
+        for user_id, object_id in pairs
+    )
+    transaction.on_commit(assign_positions)
+
+
+def assign_positions():
+    """Выдаёт позиции закоммиченным записям без позиции.
+
+    Вызывается после коммита, поэтому позиции идут в порядке коммитов:
+    запись из долгой транзакции получает позицию после всех, кто успел
+    закоммититься раньше. В SQLite записи пишутся по очереди, и порядок
+    id уже совпадает с порядком коммитов.
+    """
+    if connection.vendor == 'postgresql':
+        position = RawSQL('nextval(%s)', (POSITION_SEQUENCE,))
+    else:
+        position = F('id')
+    ChangeLogEntry.objects.filter(position__isnull=True).update(
+        position=position, sequenced=timezone.now()
+    )
+
+
+def visible_before():
+    """Граница видимости записей.
+
+    Позиция выдаётся отдельным коротким UPDATE после коммита, и запись
+    с меньшей позицией может стать видна чуть позже. Свежие позиции
+    отдаются с задержкой CHANGE_LOG_LAG секунд, чтобы курсор их не
+    перескочил; длина транзакции, записавшей изменение, на это не влияет.
+    """
+    return timezone.now() - timedelta(seconds=CHANGE_LOG_LAG)
+
+
+def get_head():
+    """Курсор на конец журнала для начала синхронизации."""
+    return ChangeLogEntry.objects.filter(
+        sequenced__lt=visible_before()
+    ).aggregate(head=Max('position'))['head'] or 0
+
+
+def is_expired(since):
+    """Курсор старше сжатой части журнала: нужна полная синхронизация."""
+    oldest = ChangeLogEntry.objects.aggregate(
+        oldest=Min('position')
+    )['oldest']
+    return oldest is not None and since < oldest - 1
+
+
+def read_changes(user, since, limit):
+    """Изменения, видимые пользователю, после курсора since по порядку."""
+    return list(ChangeLogEntry.objects.filter(
+        Q(user__isnull=True) | Q(user=user),
+        position__gt=since, sequenced__lt=visible_before()
+    ).order_by('position')[:limit])
+
+
+def compact(retention):
+    """Сжимает журнал.
+
+    Удаляет записи, для которых есть более новая запись о том же объекте,
+    и все записи старше retention, кроме самой последней: по ней
+    is_expired отличает устаревшие курсоры.
+    """
+    sequenced = ChangeLogEntry.objects.filter(position__isnull=False)
+    superseded, _ = ChangeLogEntry.objects.filter(id__in=row_number_filter(
+        sequenced, ('kind', 'user_id', 'object_id'),
+        (F('position').desc(),), '>', 1
+    )).delete()
+    last = sequenced.aggregate(last=Max('position'))['last']
+    expired, _ = sequenced.filter(
+        created__lt=timezone.now() - retention
+    ).exclude(position=last).delete()
+    return superseded, expired
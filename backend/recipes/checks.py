@@ -0,0 +1,25 @@
+from django.core.checks import Tags, Warning, register
+from django.db import connections
+
+from recipes.search import missing_sqlite_triggers
+
+
+@register(Tags.database)
+def check_search_triggers(app_configs, databases=None, **kwargs):
+    """Поиск в SQLite работает, только пока живы триггеры FTS5."""
+    warnings = []
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        missing = missing_sqlite_triggers(connection)
+        if missing:
+            warnings.append(Warning(
+                f'В базе {alias!r} нет триггеров поиска: '
+                f'{", ".join(missing)}. Новые и изменённые рецепты '
+                'не попадут в результаты поиска.',
+                hint='Выполните migrate: триггеры создаются заново '
+                     'после миграций.',
+                id='recipes.W001',
+            ))
+    return warnings
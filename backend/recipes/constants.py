@@ -3,7 +3,37 @@ MIN_COOKING_TIME = 1
 SOME_RESRICTION = 150
 SHORT_LINK_MAX_LENGTH = 255
 SHORT_LINK_MAX_POSTFIX = 10
+SHORT_LINK_ALPHABET = (
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+SHORT_LINK_CACHE_SIZE = 10000
+# Сколько прокси и браузеры помнят редирект уже удалённого рецепта.
+SHORT_LINK_MAX_AGE = 60 * 5
+LOCAL_STATE_MAX_AGE = 60
+CACHE_STATS_FLUSH_SIZE = 100
 URL = 'https://foodgramgigarf.ddns.net/s/'
 PAGE_SIZE = 6
 MIN_INGREDIENT_COUNT = 1
 MAX_VIEW_LENGTH = 20
+MAX_IMAGE_PIXELS = 40_000_000
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1600, 1600),
+}
+UPLOAD_PREFIX = 'upload:'
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_EXPIRY = 60 * 60 * 24
+BASE64_CHUNK_SIZE = 64 * 1024
+MEDIA_NAME_MAX_LENGTH = 100
+MEDIA_GRACE_PERIOD = 60 * 60 * 24
+RECIPE_BULK_MAX_SIZE = 500
+TIMELINE_MAX_LENGTH = 1000
+TIMELINE_TRIM_INTERVAL = 50
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 50
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+CHANGE_LOG_LAG = 2
+CHANGE_LOG_RETENTION_DAYS = 30
@@ -0,0 +1,53 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно сдвигает счётчик у записей кверисета, не опускаясь ниже 0."""
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def shift_counters(model, field, ids, sign=1):
+    """Сдвигает счётчик на число вхождений id записи в ids со знаком sign."""
+    by_count = defaultdict(list)
+    for pk, count in Counter(ids).items():
+        by_count[count].append(pk)
+    for count, pks in by_count.items():
+        change_counter(model.objects.filter(pk__in=pks), field, sign * count)
+
+
+def count_subquery(queryset, field):
+    """Подзапрос с числом записей queryset, ссылающихся на строку по field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def get_counters():
+    """Описание денормализованных счётчиков: модель, поле, фактическое."""
+    from django.contrib.auth import get_user_model
+
+    from recipes.models import Favorite, Recipe
+    from user.models import Follow
+
+    User = get_user_model()
+    return (
+        (Recipe, 'favorites_count',
+         count_subquery(Favorite.objects.all(), 'recipe')),
+        (User, 'recipes_count',
+         count_subquery(Recipe.objects.all(), 'author')),
+        (User, 'followers_count',
+         count_subquery(Follow.objects.all(), 'following')),
+    )
+
+
+def recount(model, field, actual, pks=None):
+    """Пересчитывает счётчик у указанных (или всех) записей модели."""
+    queryset = model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    return queryset.update(**{field: actual})
@@ -0,0 +1,163 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from recipes.constants import IMAGE_VARIANTS, MAX_IMAGE_PIXELS
+
+IMAGE_FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+# Форматы оригиналов, которые пересохраняются без метаданных.
+ORIGINAL_FORMATS = {
+    'JPEG': 'JPEG', 'MPO': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP',
+}
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+EXIF_ORIENTATION = 0x0112
+
+logger = logging.getLogger(__name__)
+executor = None
+
+
+def get_variant_name(name, variant, image_format):
+    """Имя файла уменьшенной копии рядом с оригиналом."""
+    root, _ = os.path.splitext(name)
+    extension, _ = IMAGE_FORMATS[image_format]
+    return f'{root}__{variant}.{extension}'
+
+
+def get_variant_names(name):
+    return {
+        variant: {
+            image_format: get_variant_name(name, variant, image_format)
+            for image_format in IMAGE_FORMATS
+        }
+        for variant in IMAGE_VARIANTS
+    }
+
+
+def get_original_root(name):
+    """Имя оригинала без расширения для уменьшенной копии или None."""
+    root, extension = os.path.splitext(name)
+    for variant in IMAGE_VARIANTS:
+        if root.endswith(f'__{variant}') and any(
+            extension == f'.{suffix}' for suffix, _ in IMAGE_FORMATS.values()
+        ):
+            return root[:-len(variant) - 2]
+    return None
+
+
+def check_pixels(image):
+    """Отказывается декодировать картинку больше MAX_IMAGE_PIXELS.
+
+    Проверка по размерам из заголовка, до чтения пикселей; глобальный
+    Image.MAX_IMAGE_PIXELS не трогаем, он общий для всего процесса.
+    """
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise Image.DecompressionBombError(
+            f'Картинка {image.width}x{image.height} больше '
+            f'{MAX_IMAGE_PIXELS} пикселей.'
+        )
+
+
+def build_variants(path, force=False):
+    """Строит уменьшенные копии картинки в JPEG и WebP без метаданных.
+
+    Выполняется в отдельном процессе и работает только с файловой
+    системой, без Django.
+    """
+    targets = [
+        (size, image_format, os.path.join(
+            os.path.dirname(path),
+            os.path.basename(get_variant_name(path, variant, image_format))
+        ))
+        for variant, size in IMAGE_VARIANTS.items()
+        for image_format in IMAGE_FORMATS
+    ]
+    if not force and all(os.path.exists(target) for *_, target in targets):
+        return 0
+    with Image.open(path) as image:
+        check_pixels(image)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, image_format, target in targets:
+            copy = image.copy()
+            copy.thumbnail(size, Image.LANCZOS)
+            _, options = IMAGE_FORMATS[image_format]
+            copy.save(target, image_format.upper(), **options)
+    return len(targets)
+
+
+def has_metadata(image):
+    return (
+        bool(image.getexif())
+        or any(image.info.get(key) for key in METADATA_KEYS)
+        or bool(getattr(image, 'text', None))
+    )
+
+
+def strip_metadata(source, target):
+    """Пересохраняет оригинал картинки без EXIF, XMP и комментариев.
+
+    Поворот из EXIF применяется к пикселям, ICC-профиль сохраняется.
+    source и target — путь или файл, могут совпадать. Возвращает False
+    и ничего не пишет, если метаданных нет или формат не поддерживается.
+    """
+    with Image.open(source) as image:
+        check_pixels(image)
+        image_format = ORIGINAL_FORMATS.get(image.format)
+        if image_format is None or not has_metadata(image):
+            return False
+        image.load()
+        options = {'exif': b'', 'xmp': b'', 'comment': b''}
+        if image.info.get('icc_profile'):
+            options['icc_profile'] = image.info['icc_profile']
+        if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG':
+            options['quality'] = 'keep' if image.format == 'JPEG' else 95
+        elif image_format == 'WEBP':
+            options['quality'] = 90
+        image.save(target, image_format, **options)
+    return True
+
+
+def get_executor():
+    """Пул процессов для копий; процессы запускаются через spawn.
+
+    fork из многопоточного воркера копирует чужие захваченные блокировки
+    и открытые соединения с базой, поэтому процессы стартуют с нуля.
+    """
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return executor
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось обработать картинку', exc_info=future.exception()
+        )
+
+
+def submit(path, force=False):
+    future = get_executor().submit(build_variants, path, force)
+    future.add_done_callback(log_failure)
+    return future
+
+
+def schedule_variants(field_file):
+    """Ставит построение копий в очередь после коммита транзакции."""
+    if not field_file:
+        return
+    path = field_file.path
+    transaction.on_commit(lambda: submit(path))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.helpers import ShortLink
+from recipes.models import Recipe
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Заполнение коротких ссылок у рецептов, где их ещё нет."""
+
+    def handle(self, *args, **options):
+        short_link = ShortLink()
+        recipes = Recipe.objects.filter(
+            short_link__isnull=True
+        ).only('id').order_by('id')
+        filled = 0
+        chunk = []
+        for recipe in recipes.iterator(chunk_size=CHUNK_SIZE):
+            recipe.short_link = short_link.create_short_link(recipe.id)
+            chunk.append(recipe)
+            if len(chunk) == CHUNK_SIZE:
+                filled += self.save(chunk)
+                chunk = []
+        filled += self.save(chunk)
+        self.stdout.write(f'Заполнено коротких ссылок: {filled}')
+
+    def save(self, recipes):
+        Recipe.objects.bulk_update(recipes, ('short_link',))
+        return len(recipes)
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.filters import IngredientFilter
+from api.ingredient_index import ingredient_index
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+DEFAULT_QUERIES = ('а', 'ба', 'мол', 'сыр', 'карто', 'соус', 'я')
+
+
+class Command(BaseCommand):
+    """Сравнение поиска ингредиентов через ORM и через индекс в памяти."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_index.search('')
+        self.stdout.write(
+            f'Ингредиентов: {Ingredient.objects.count()}, '
+            f'повторов: {repeat}'
+        )
+        for query in options['queries']:
+            orm = self.measure(self.orm_search, query, repeat)
+            index = self.measure(ingredient_index.search, query, repeat)
+            self.stdout.write(
+                f'{query!r}: ORM {orm * 1000:.3f} мс, '
+                f'индекс {index * 1000:.3f} мс, '
+                f'ускорение x{orm / index:.0f}'
+            )
+
+    def orm_search(self, query):
+        queryset = IngredientFilter(
+            {'name': query}, queryset=Ingredient.objects.all()
+        ).qs
+        prefix = IngredientSerializer(queryset, many=True).data
+        substring = IngredientSerializer(
+            Ingredient.objects.filter(
+                Q(name__icontains=query) & ~Q(name__istartswith=query)
+            ),
+            many=True
+        ).data
+        return prefix + substring
+
+    def measure(self, search, query, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            search(query)
+        return (time.perf_counter() - start) / repeat
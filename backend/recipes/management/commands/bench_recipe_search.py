@@ -0,0 +1,120 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.constants import PAGE_SIZE
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.search import fallback_search, search_recipes
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+INGREDIENTS_PER_RECIPE = 5
+DEFAULT_QUERIES = ('борщ', 'куриный суп', 'шоколадный торт', 'капуста')
+WORDS = (
+    'борщ', 'суп', 'щи', 'солянка', 'салат', 'котлеты', 'плов', 'блины',
+    'пирог', 'торт', 'запеканка', 'омлет', 'каша', 'рагу', 'жаркое',
+    'куриный', 'грибной', 'овощной', 'шоколадный', 'домашний', 'быстрый',
+    'классический', 'постный', 'сырный', 'летний', 'праздничный',
+    'с', 'из', 'по-деревенски', 'в', 'духовке', 'мультиварке', 'сметаной',
+    'картофелем', 'капустой', 'мясом', 'рыбой', 'ягодами', 'творогом',
+)
+
+
+class Command(BaseCommand):
+    """Замер полнотекстового поиска рецептов на синтетическом корпусе.
+
+    Корпус создаётся в транзакции, которая по умолчанию откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--count', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Оставить корпус в базе после замера'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.build_corpus(options['count'])
+            self.stdout.write(f'Рецептов в базе: {Recipe.objects.count()}')
+            for query in options['queries']:
+                indexed = self.measure(
+                    lambda: search_recipes(Recipe.objects.all(), query),
+                    options['repeat']
+                )
+                naive = self.measure(
+                    lambda: self.naive_search(query), options['repeat']
+                )
+                self.stdout.write(
+                    f'{query!r}: индекс {indexed * 1000:.1f} мс, '
+                    f'icontains {naive * 1000:.1f} мс, '
+                    f'ускорение x{naive / indexed:.1f}'
+                )
+            transaction.set_rollback(not options['keep'])
+
+    def build_corpus(self, count):
+        random.seed(count)
+        author = User.objects.create(
+            username=f'bench-{time.time_ns()}', email='bench@example.com'
+        )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+                for number in range(500)
+            )
+            ingredient_ids = list(
+                Ingredient.objects.values_list('id', flat=True)
+            )
+        started = time.monotonic()
+        last_id = 0
+        for offset in range(0, count, BATCH_SIZE):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=' '.join(random.sample(WORDS, 3)),
+                    text=' '.join(random.choices(WORDS, k=30)),
+                    cooking_time=random.randint(5, 120),
+                    image='images/bench.jpg',
+                )
+                for _ in range(min(BATCH_SIZE, count - offset))
+            )
+            ids = list(Recipe.objects.filter(
+                author=author, id__gt=last_id
+            ).order_by('id').values_list('id', flat=True))
+            last_id = ids[-1]
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id,
+                        amount=random.randint(1, 500)
+                    )
+                    for recipe_id in ids
+                    for ingredient_id in random.sample(
+                        ingredient_ids,
+                        min(INGREDIENTS_PER_RECIPE, len(ingredient_ids))
+                    )
+                ),
+                batch_size=BATCH_SIZE
+            )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Корпус: {count} рецептов за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-6):.0f} рецептов/с)'
+        )
+
+    def naive_search(self, query):
+        return fallback_search(Recipe.objects.all(), query).order_by('-id')
+
+    def measure(self, search, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(search()[:PAGE_SIZE])
+        return (time.perf_counter() - start) / repeat
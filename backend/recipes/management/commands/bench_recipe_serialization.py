@@ -0,0 +1,60 @@
+import json
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer
+from api.serializers import (FLAT_RECIPE_FIELDS, FlatRecipeSerializer,
+                             GetRecipeSerializer)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Сравнение сериализации списка рецептов: DRF против плоской модели."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        context = {'request': request}
+        queryset = Recipe.objects.with_user_flags(request.user)
+        limit = options['limit']
+
+        def current():
+            return JSONRenderer().render(GetRecipeSerializer(
+                queryset.with_related()[:limit], many=True, context=context
+            ).data)
+
+        def flat():
+            return FastJSONRenderer().render(FlatRecipeSerializer(
+                queryset.values(*FLAT_RECIPE_FIELDS)[:limit],
+                many=True, context=context
+            ).data)
+
+        if json.loads(current()) != json.loads(flat()):
+            self.stderr.write('Представления различаются')
+        self.stdout.write(
+            f'Рецептов на странице: {len(json.loads(flat()))}, '
+            f'повторов: {options["repeat"]}, '
+            f'байты совпадают: {current() == flat()}'
+        )
+        current_time = self.measure(current, options['repeat'])
+        flat_time = self.measure(flat, options['repeat'])
+        self.stdout.write(
+            f'DRF + json: {current_time * 1000:.2f} мс, '
+            f'плоская модель + orjson: {flat_time * 1000:.2f} мс, '
+            f'ускорение x{current_time / flat_time:.1f}'
+        )
+
+    def measure(self, render, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - start) / repeat
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.shortcuts import get_object_or_404, redirect
+from django.test import RequestFactory
+
+from api.views import redirect_to_recipe_detail, resolve_short_link
+from recipes.models import Recipe
+
+
+def redirect_with_lookup(request, short_link_code):
+    recipe = get_object_or_404(Recipe, short_link=short_link_code)
+    return redirect('api:recipe-detail', pk=recipe.id)
+
+
+class Command(BaseCommand):
+    """Пропускная способность редиректа по коротким ссылкам."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--links', type=int, default=100)
+
+    def handle(self, *args, **options):
+        codes = list(Recipe.objects.filter(
+            short_link__isnull=False
+        ).values_list('short_link', flat=True)[:options['links']])
+        if not codes:
+            self.stderr.write(
+                'Нет рецептов с короткими ссылками, '
+                'запустите backfill_short_links'
+            )
+            return
+        factory = RequestFactory()
+        requests = [
+            (factory.get(f'/s/{code}/'), code)
+            for code in codes
+        ] * (options['requests'] // len(codes) + 1)
+        requests = requests[:options['requests']]
+        resolve_short_link.cache_clear()
+        for name, view in (
+            ('Поиск в базе', redirect_with_lookup),
+            ('Кеш + base62', redirect_to_recipe_detail),
+        ):
+            start = time.perf_counter()
+            for request, code in requests:
+                view(request, code)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f'{name}: {len(requests) / elapsed:.0f} редиректов/с'
+            )
+        self.stdout.write(str(resolve_short_link.cache_info()))
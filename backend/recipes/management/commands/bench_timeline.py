@@ -0,0 +1,169 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from recipes.constants import PAGE_SIZE
+from recipes.counters import shift_counters
+from recipes.models import Recipe
+from recipes.timeline import after, fan_out, read_feed
+from user.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    """Сравнение ленты с раскладкой при записи и сборки ленты при чтении.
+
+    Граф подписок синтетический: популярность авторов убывает как 1/ранг,
+    первые --large авторов читают все, рецепты публикуют все авторы
+    поровну. Данные создаются в транзакции,
+    которая откатывается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--authors', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=100,
+            help='Подписок у каждого пользователя'
+        )
+        parser.add_argument(
+            '--large', type=int, default=2,
+            help='Авторов, на которых подписаны все'
+        )
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--sample', type=int, default=200)
+        parser.add_argument(
+            '--fanout-limit', type=int, default=None,
+            help='По умолчанию — половина числа пользователей'
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['users'])
+        fanout_limit = options['fanout_limit']
+        if fanout_limit is None:
+            fanout_limit = options['users'] // 2
+        with override_settings(TIMELINE_FANOUT_LIMIT=fanout_limit):
+            with transaction.atomic():
+                self.run(options)
+                transaction.set_rollback(True)
+
+    def run(self, options):
+        stamp = time.time_ns()
+        users = self.create_users(f'bench-{stamp}', options['users'])
+        authors = users[:options['authors']]
+        self.create_follows(users, authors, options)
+        recipe_ids = self.create_recipes(authors, options['recipes'])
+
+        started = time.perf_counter()
+        entries = sum(fan_out([pk]) for pk in recipe_ids)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Раскладка: {len(recipe_ids)} рецептов, {entries} записей '
+            f'за {elapsed:.1f} с ({entries / max(elapsed, 1e-6):.0f} '
+            f'записей/с, {elapsed / len(recipe_ids) * 1000:.1f} мс '
+            'на рецепт)'
+        )
+
+        readers = random.sample(users, min(options['sample'], len(users)))
+        timeline_time = read_time = 0
+        mismatches = 0
+        for user_id in readers:
+            user = User(pk=user_id)
+            started = time.perf_counter()
+            feed = read_feed(user, limit=PAGE_SIZE)
+            if feed:
+                read_feed(user, feed[-1], PAGE_SIZE)
+            timeline_time += time.perf_counter() - started
+            started = time.perf_counter()
+            naive = self.read_naive(user_id, None)
+            if naive:
+                self.read_naive(user_id, naive[-1])
+            read_time += time.perf_counter() - started
+            mismatches += feed != naive
+        self.stdout.write(
+            f'Чтение двух страниц, среднее по {len(readers)} '
+            f'пользователям: лента {timeline_time / len(readers) * 1000:.2f}'
+            f' мс, при чтении {read_time / len(readers) * 1000:.2f} мс'
+        )
+        self.stdout.write(f'Расхождений первой страницы: {mismatches}')
+
+    def create_users(self, prefix, count):
+        for start in range(0, count, BATCH_SIZE):
+            User.objects.bulk_create(
+                User(
+                    username=f'{prefix}-{number}',
+                    email=f'{prefix}-{number}@example.com',
+                    password='!'
+                )
+                for number in range(start, min(start + BATCH_SIZE, count))
+            )
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_follows(self, users, authors, options):
+        large = authors[:options['large']]
+        regular = authors[options['large']:]
+        weights = [1 / rank for rank in range(1, len(regular) + 1)]
+        follows = []
+        for user_id in users:
+            following = set(large)
+            following.update(random.choices(
+                regular, weights, k=options['follows']
+            ))
+            following.discard(user_id)
+            follows.extend(
+                Follow(user_id=user_id, following_id=author_id)
+                for author_id in following
+            )
+        Follow.objects.bulk_create(follows, batch_size=BATCH_SIZE)
+        shift_counters(
+            User, 'followers_count',
+            [follow.following_id for follow in follows]
+        )
+        self.stdout.write(
+            f'Подписок: {len(follows)}, крупных авторов: {len(large)}'
+        )
+
+    def create_recipes(self, authors, count):
+        started = timezone.now() - timedelta(seconds=count)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author_id,
+                    name=f'Рецепт {number}',
+                    text='Синтетический рецепт',
+                    cooking_time=10,
+                    image='images/bench.jpg',
+                    pub_date=started + timedelta(seconds=number),
+                )
+                for number, author_id in enumerate(
+                    random.choices(authors, k=count)
+                )
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return list(Recipe.objects.filter(
+            author_id__in=authors
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def read_naive(self, user_id, position):
+        recipes = Recipe.objects.filter(
+            author__in=Follow.objects.filter(user_id=user_id).values(
+                'following_id'
+            )
+        )
+        if position is not None:
+            recipes = recipes.filter(after(position, 'pub_date', 'id'))
+        return list(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:PAGE_SIZE])
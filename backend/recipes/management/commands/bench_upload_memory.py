@@ -0,0 +1,47 @@
+import base64
+import io
+import os
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from api.helpers import decode_base64_file
+
+
+def decode_in_memory(encoded):
+    """Прежний путь: вся картинка декодируется в память и копируется."""
+    file = ContentFile(base64.b64decode(encoded), name='image.jpg')
+    return io.BytesIO(file.read())
+
+
+def decode_streaming(encoded):
+    file = decode_base64_file(encoded, name='image.jpg')
+    file.close()
+
+
+class Command(BaseCommand):
+    """Пиковая память при декодировании base64-картинки."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=20)
+
+    def handle(self, *args, **options):
+        size = options['size_mb'] * 1024 * 1024
+        encoded = base64.b64encode(os.urandom(size)).decode()
+        self.stdout.write(
+            f'Картинка {options["size_mb"]} МБ, '
+            f'base64 {len(encoded) / 1024 / 1024:.1f} МБ'
+        )
+        for name, decode in (
+            ('В памяти', decode_in_memory),
+            ('Частями на диск', decode_streaming),
+        ):
+            tracemalloc.start()
+            decode(encoded)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{name}: пик {peak / 1024 / 1024:.1f} МБ '
+                f'сверх строки запроса'
+            )
@@ -0,0 +1,57 @@
+from concurrent.futures import as_completed
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes import images
+from recipes.models import Recipe
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Построение уменьшенных копий для уже загруженных картинок."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересобрать копии, даже если они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        sources = (
+            Recipe.objects.exclude(image='').values_list('image', flat=True),
+            User.objects.exclude(avatar__isnull=True).exclude(
+                avatar=''
+            ).values_list('avatar', flat=True),
+        )
+        storage = Recipe._meta.get_field('image').storage
+        processed = failed = 0
+        futures = []
+        for names in sources:
+            for name in names.order_by('pk').iterator(chunk_size=CHUNK_SIZE):
+                futures.append(
+                    images.submit(storage.path(name), options['force'])
+                )
+                if len(futures) == CHUNK_SIZE:
+                    done, errors = self.wait(futures)
+                    processed, failed = processed + done, failed + errors
+                    futures = []
+        done, errors = self.wait(futures)
+        self.stdout.write(
+            f'Обработано картинок: {processed + done}, '
+            f'с ошибкой: {failed + errors}'
+        )
+
+    def wait(self, futures):
+        done = errors = 0
+        for future in as_completed(futures):
+            if future.exception() is None:
+                done += 1
+            else:
+                errors += 1
+                self.stderr.write(str(future.exception()))
+        return done, errors
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """Попадания и промахи кеша ответов для анонимных пользователей."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = stats['hit'] + stats['miss']
+        ratio = stats['hit'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {stats["hit"]}, промахов: {stats["miss"]}, '
+            f'доля попаданий: {ratio:.1f}%'
+        )
+        if options['reset']:
+            reset_stats()
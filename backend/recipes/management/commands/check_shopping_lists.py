@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes import shopping_list
+from recipes.models import ShoppingListItem
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Сверка списков покупок с корзинами пользователей."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересобрать расходящиеся списки покупок'
+        )
+
+    def handle(self, *args, **options):
+        checked = broken = 0
+        user_ids = User.objects.values_list('pk', flat=True).order_by('pk')
+        chunk = []
+        for user_id in user_ids.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(user_id)
+            if len(chunk) == CHUNK_SIZE:
+                broken += self.check_chunk(chunk, options['fix'])
+                checked += len(chunk)
+                chunk = []
+        if chunk:
+            broken += self.check_chunk(chunk, options['fix'])
+            checked += len(chunk)
+        self.stdout.write(
+            f'Проверено пользователей: {checked}, расхождений: {broken}'
+            + (', исправлено' if options['fix'] and broken else '')
+        )
+
+    def check_chunk(self, user_ids, fix):
+        actual = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in shopping_list.get_actual_totals(user_ids)
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'ingredient_id', 'amount')
+        }
+        broken = sorted({
+            user_id for user_id, _ in actual.keys() ^ stored.keys()
+        } | {
+            key[0] for key in actual.keys() & stored.keys()
+            if actual[key] != stored[key]
+        })
+        for user_id in broken:
+            self.stdout.write(f'Список покупок пользователя {user_id} '
+                              f'расходится с корзиной')
+        if fix and broken:
+            shopping_list.rebuild(broken)
+        return len(broken)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import time
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.constants import MEDIA_GRACE_PERIOD
+from recipes.images import get_original_root
+from recipes.storage import get_media_fields, media_storage
+
+CHUNK_SIZE = 500
+PROGRESS_EVERY = 10000
+
+
+class Command(BaseCommand):
+    """Удаление файлов из media, на которые не ссылается ни одна запись."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы без ссылок, ничего не удаляя'
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=MEDIA_GRACE_PERIOD,
+            help='Не трогать файлы моложе указанного числа секунд'
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить файлы в этот каталог вместо удаления'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.scanned = self.collected = self.size = 0
+        self.started = time.monotonic()
+        fields = get_media_fields()
+        chunk = []
+        for directory in {
+            model._meta.get_field(field).upload_to.strip('/')
+            for model, field in fields
+        }:
+            for entry in self.walk(media_storage.path(directory)):
+                chunk.append(entry)
+                if len(chunk) == CHUNK_SIZE:
+                    self.collect(chunk, fields)
+                    chunk = []
+        if chunk:
+            self.collect(chunk, fields)
+        self.report()
+
+    def walk(self, path):
+        """Обходит каталог без построения полного списка файлов."""
+        deadline = time.time() - self.options['grace']
+        stack = [path]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        self.scanned += 1
+                        if self.scanned % PROGRESS_EVERY == 0:
+                            self.report()
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime < deadline:
+                            yield entry.path, stat.st_size
+
+    def collect(self, chunk, fields):
+        names = {
+            os.path.relpath(path, media_storage.location).replace(os.sep, '/'):
+            (path, size)
+            for path, size in chunk
+        }
+        originals = {name: get_original_root(name) for name in names}
+        referenced = self.get_referenced(
+            [name for name, root in originals.items() if root is None],
+            {root for root in originals.values() if root is not None},
+            fields
+        )
+        for name, (path, size) in names.items():
+            root = originals[name]
+            if root is None and name in referenced:
+                continue
+            if root is not None and any(
+                reference.startswith(f'{root}.') for reference in referenced
+            ):
+                continue
+            self.collected += 1
+            self.size += size
+            if self.options['dry_run']:
+                self.stdout.write(name)
+            elif self.options['quarantine']:
+                target = os.path.join(self.options['quarantine'], name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+
+    def get_referenced(self, names, roots, fields):
+        referenced = set()
+        for model, field in fields:
+            conditions = [Q(**{f'{field}__in': names})] + [
+                Q(**{f'{field}__startswith': f'{root}.'}) for root in roots
+            ]
+            referenced.update(
+                model.objects.filter(reduce(or_, conditions)).values_list(
+                    field, flat=True
+                )
+            )
+        return referenced
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'Просмотрено: {self.scanned}, без ссылок: {self.collected} '
+            f'({self.size // 1024} КБ), {elapsed:.1f} с'
+        )
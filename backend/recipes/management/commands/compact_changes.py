@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from recipes.changes import compact
+from recipes.constants import CHANGE_LOG_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    """Сжатие журнала изменений."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=CHANGE_LOG_RETENTION_DAYS,
+            help='Сколько дней хранить записи журнала'
+        )
+
+    def handle(self, *args, **options):
+        superseded, expired = compact(timedelta(days=options['days']))
+        self.stdout.write(
+            f'Удалено устаревших повторов: {superseded}, '
+            f'старых записей: {expired}'
+        )
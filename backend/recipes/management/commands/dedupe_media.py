@@ -0,0 +1,66 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from recipes.storage import (get_hashed_name, get_media_fields,
+                             get_referenced_names, hash_file, is_hashed_name,
+                             media_storage, rebuild_references)
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Перенос загруженных файлов в хранилище с адресацией по содержимому."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать дубликаты, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        moved = duplicates = missing = freed = 0
+        planned = set()
+        for model, field in get_media_fields():
+            names = get_referenced_names(model, field).distinct().order_by(
+                field
+            )
+            for name in names.iterator(chunk_size=CHUNK_SIZE):
+                if is_hashed_name(name):
+                    continue
+                if not media_storage.exists(name):
+                    missing += 1
+                    continue
+                with media_storage.open(name) as content:
+                    target = get_hashed_name(name, hash_file(content))
+                if target in planned or media_storage.exists(target):
+                    duplicates += 1
+                    freed += media_storage.size(name)
+                    if options['dry_run']:
+                        continue
+                else:
+                    moved += 1
+                    if options['dry_run']:
+                        planned.add(target)
+                        continue
+                    path = media_storage.path(target)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(media_storage.path(name), path)
+                media_storage.remove(name)
+                model.objects.filter(**{field: name}).update(
+                    **{field: target}
+                )
+        if not options['dry_run']:
+            self.stdout.write(
+                f'Файлов с учётом ссылок: {rebuild_references()}'
+            )
+        self.stdout.write(
+            f'Перенесено: {moved}, дубликатов: {duplicates} '
+            f'({freed // 1024} КБ), не найдено: {missing}'
+        )
+        if moved and not options['dry_run']:
+            self.stdout.write(
+                'Уменьшенные копии пересобираются командой '
+                'build_image_variants'
+            )
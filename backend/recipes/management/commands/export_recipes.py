@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import sys
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.storage import media_storage
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+
+
+def get_last_id(path):
+    """id последнего записанного рецепта; недописанная строка отрезается."""
+    with open(path, 'rb+') as file:
+        end = position = file.seek(0, os.SEEK_END)
+        while position > 0:
+            position = max(position - READ_SIZE, 0)
+            file.seek(position)
+            lines = file.read(end - position).split(b'\n')
+            if len(lines) > 2 or position == 0 and len(lines) > 1:
+                file.truncate(end - len(lines[-1]))
+                return json.loads(lines[-2])['id']
+        file.truncate(0)
+    return None
+
+
+class Command(BaseCommand):
+    """Потоковая выгрузка рецептов в NDJSON."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл выгрузки или - для вывода в stdout'
+        )
+        parser.add_argument(
+            '--media', help='Каталог, куда скопировать картинки рецептов'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Дописать файл, начиная с рецепта после последнего в нём'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        last_id = None
+        if options['resume'] and path != '-' and os.path.exists(path):
+            last_id = get_last_id(path)
+        if path == '-':
+            output = sys.stdout
+        else:
+            output = open(path, 'a' if options['resume'] else 'w',
+                          encoding='utf-8')
+        exported = 0
+        try:
+            for chunk in self.chunks(last_id):
+                for record in chunk:
+                    if options['media']:
+                        self.copy_image(record['image'], options['media'])
+                    output.write(json.dumps(record, ensure_ascii=False))
+                    output.write('\n')
+                exported += len(chunk)
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f'Выгружено рецептов: {exported}')
+
+    def chunks(self, last_id):
+        """Рецепты порциями по возрастанию id вместе со связями."""
+        recipes = Recipe.objects.order_by('id').values(
+            'id', 'name', 'text', 'image', 'cooking_time', 'pub_date',
+            'author__username'
+        )
+        while True:
+            chunk = list(
+                (recipes if last_id is None else recipes.filter(
+                    id__gt=last_id
+                ))[:CHUNK_SIZE]
+            )
+            if not chunk:
+                return
+            last_id = chunk[-1]['id']
+            yield self.build_records(chunk)
+
+    def build_records(self, chunk):
+        ids = [recipe['id'] for recipe in chunk]
+        ingredients = {recipe_id: [] for recipe_id in ids}
+        for recipe_id, name, unit, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=ids
+        ).order_by('id').values_list(
+            'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+            'amount'
+        ):
+            ingredients[recipe_id].append({
+                'name': name, 'measurement_unit': unit, 'amount': amount
+            })
+        tags = {recipe_id: [] for recipe_id in ids}
+        for recipe_id, name, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).values_list('recipe_id', 'tag__name', 'tag__slug'):
+            tags[recipe_id].append({'name': name, 'slug': slug})
+        return [
+            {
+                'id': recipe['id'],
+                'author': recipe['author__username'],
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'cooking_time': recipe['cooking_time'],
+                'pub_date': recipe['pub_date'].isoformat(),
+                'image': recipe['image'],
+                'tags': tags[recipe['id']],
+                'ingredients': ingredients[recipe['id']],
+            }
+            for recipe in chunk
+        ]
+
+    def copy_image(self, name, directory):
+        target = os.path.join(directory, name)
+        if not name or os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            shutil.copyfile(media_storage.path(name), target)
+        except FileNotFoundError:
+            self.stderr.write(f'Нет файла картинки {name}')
@@ -1,25 +1,142 @@
+import csv
+import io
 import json
+import time
+from pathlib import Path
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from tqdm import tqdm
+from django.db import connection, transaction
 
-from foodgram_backend.settings import PATH_TO_INGREDIENTS
+from recipes.bulk import BATCH_SIZE, send_bulk_changed
 from recipes.models import Ingredient
 
+READ_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n[],'
+CSV_HEADER = ['name', 'measurement_unit']
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row and row != CSV_HEADER:
+            yield row
+
+
+def read_json(file):
+    """Объекты из JSON-массива или JSON Lines, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(READ_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while (
+                position < len(buffer) and buffer[position] in JSON_SEPARATORS
+            ):
+                position += 1
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield [item.get('name'), item.get('measurement_unit')]
+        buffer = buffer[position:]
+    if buffer.strip(JSON_SEPARATORS):
+        raise CommandError(f'Некорректный JSON: {buffer[:100]}')
+
+
+READERS = {'.csv': read_csv, '.json': read_json, '.jsonl': read_json}
+
+
+def read_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        if len(row) < 2 or not row[0] or not row[1]:
+            raise CommandError(f'Некорректная строка: {row}')
+        batch.append((row[0].strip(), row[1].strip()))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_ingredients(batches):
+    """Загрузка через COPY во временную таблицу и один INSERT без конфликтов.
+
+    Работает только в PostgreSQL.
+    """
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    read = 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_load '
+            '(name text, measurement_unit text) ON COMMIT DROP'
+        )
+        for batch in batches:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(
+                'COPY ingredient_load FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            read += len(batch)
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredient_load '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+        return read, cursor.rowcount
+
+
+def bulk_create_ingredients(batches):
+    before = Ingredient.objects.count()
+    read = 0
+    for batch in batches:
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ),
+            ignore_conflicts=True
+        )
+        read += len(batch)
+    return read, Ingredient.objects.count() - before
+
 
 class Command(BaseCommand):
-    """Заполнение базы ингридиентами"""
+    """Заполнение базы ингридиентами из CSV или JSON."""
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=Path,
+            default=settings.PATH_TO_INGREDIENTS,
+            help='Файл с ингредиентами: .csv, .json или .jsonl'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько строк отправлять в базу за раз'
+        )
 
-        with open(PATH_TO_INGREDIENTS, encoding='UTF-8') as ingrrdietnds_file:
-            ingredients = json.load(ingrrdietnds_file)
-
-            for ingridient in tqdm(ingredients):
-                try:
-                    Ingredient.objects.get_or_create(**ingridient)
-                except CommandError as e:
-                    raise CommandError(
-                        f'При добавлении {ingridient} '
-                        f'произшла ошибка {e}'
-                    )
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        started = time.monotonic()
+        with open(path, encoding='utf-8', newline='') as file:
+            batches = read_batches(reader(file), options['batch_size'])
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    read, created = copy_ingredients(batches)
+                else:
+                    read, created = bulk_create_ingredients(batches)
+        if created:
+            send_bulk_changed(Ingredient)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Прочитано: {read}, добавлено новых: {created} '
+            f'за {elapsed:.2f} с ({read / max(elapsed, 1e-6):.0f} строк/с)'
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.timeline import follow
+from user.models import Follow
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Заполняет ленты по уже существующим подпискам."""
+
+    def handle(self, *args, **options):
+        last_id = 0
+        total = 0
+        while True:
+            follows = list(Follow.objects.filter(pk__gt=last_id).order_by(
+                'pk'
+            ).values_list('pk', 'user_id', 'following_id')[:BATCH_SIZE])
+            if not follows:
+                break
+            for _, user_id, author_id in follows:
+                follow(user_id, author_id)
+            last_id = follows[-1][0]
+            total += len(follows)
+            self.stdout.write(f'Обработано подписок: {total}')
@@ -0,0 +1,277 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from recipes.bulk import BATCH_SIZE, create_recipes, send_bulk_changed
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.storage import media_storage
+
+User = get_user_model()
+
+
+def read_batches(file, skip, batch_size):
+    """Порции строк файла с номером первой строки порции."""
+    batch, first = [], skip
+    for number, line in enumerate(file):
+        if number < skip:
+            continue
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield first, batch
+            batch, first = [], number + 1
+    if batch:
+        yield first, batch
+
+
+def get_or_create_tags(records):
+    """Теги по slug из выгрузки; недостающие создаются.
+
+    Тег, название которого уже занято тегом с другим slug, создать
+    нельзя: такой slug сопоставляется существующему тегу по названию.
+    """
+    tags = {
+        tag['slug']: tag for record in records for tag in record['tags']
+    }
+    found = Tag.objects.in_bulk(tags, field_name='slug')
+    missing = [Tag(**tags[slug]) for slug in tags if slug not in found]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        send_bulk_changed(Tag)
+        found = Tag.objects.in_bulk(tags, field_name='slug')
+    names = {
+        tags[slug]['name']: slug for slug in tags if slug not in found
+    }
+    for name, tag in Tag.objects.in_bulk(names, field_name='name').items():
+        found[names[name]] = tag
+    return found
+
+
+def get_or_create_ingredients(records):
+    keys = {
+        (ingredient['name'], ingredient['measurement_unit'])
+        for record in records for ingredient in record['ingredients']
+    }
+
+    def fetch():
+        return {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys},
+                measurement_unit__in={unit for _, unit in keys}
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+
+    found = fetch()
+    if keys - found.keys():
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in keys - found.keys()
+            ),
+            ignore_conflicts=True
+        )
+        send_bulk_changed(Ingredient)
+        found = fetch()
+    return found
+
+
+class Command(BaseCommand):
+    """Потоковая загрузка рецептов из NDJSON с продолжением после сбоя.
+
+    Прогресс сохраняется в файл рядом с выгрузкой. Рецепт, который уже
+    есть в базе (тот же автор, название и дата), повторно не создаётся,
+    поэтому повторный запуск после сбоя ничего не дублирует.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON из export_recipes')
+        parser.add_argument(
+            '--media', help='Каталог с картинками из export_recipes --media'
+        )
+        parser.add_argument(
+            '--author',
+            help='Автор для рецептов, чьих авторов нет в этой базе'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько рецептов сохранять в одной транзакции'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Сколько порций сохранять параллельно'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать сначала, не глядя на сохранённый прогресс'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.fallback_author = None
+        if options['author']:
+            self.fallback_author = User.objects.filter(
+                username=options['author']
+            ).first()
+            if self.fallback_author is None:
+                raise CommandError(f'Нет пользователя {options["author"]}')
+        self.checkpoint = f'{options["path"]}.checkpoint'
+        position = 0
+        if not options['restart'] and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as file:
+                position = int(file.read() or 0)
+        workers = options['workers']
+        if connection.vendor == 'sqlite':
+            workers = 1
+        self.stats = {'created': 0, 'existing': 0, 'failed': 0}
+        started = time.monotonic()
+        completed = {}
+        pending = {}
+        with open(options['path'], encoding='utf-8') as file, \
+                ThreadPoolExecutor(workers) as executor:
+            for first, lines in read_batches(
+                file, position, options['batch_size']
+            ):
+                future = executor.submit(self.import_batch, lines)
+                pending[future] = (first, first + len(lines))
+                if len(pending) >= workers * 2:
+                    position = self.collect(pending, completed, position)
+            while pending:
+                position = self.collect(pending, completed, position)
+        elapsed = time.monotonic() - started
+        total = sum(self.stats.values())
+        self.stdout.write(
+            f'Создано: {self.stats["created"]}, '
+            f'уже были: {self.stats["existing"]}, '
+            f'пропущено: {self.stats["failed"]} за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} рецептов/с)'
+        )
+
+    def collect(self, pending, completed, position):
+        """Ждёт порцию и сдвигает прогресс до первой незаконченной."""
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            first, last = pending.pop(future)
+            for key, value in future.result().items():
+                self.stats[key] += value
+            completed[first] = last
+        while position in completed:
+            position = completed.pop(position)
+        with open(f'{self.checkpoint}.tmp', 'w') as file:
+            file.write(str(position))
+        os.replace(f'{self.checkpoint}.tmp', self.checkpoint)
+        return position
+
+    def import_batch(self, lines):
+        try:
+            with transaction.atomic():
+                return self.save_records(
+                    [json.loads(line) for line in lines if line.strip()]
+                )
+        finally:
+            connection.close()
+
+    def save_records(self, records):
+        stats = {'created': 0, 'existing': 0, 'failed': 0}
+        authors = User.objects.in_bulk(
+            {record['author'] for record in records}, field_name='username'
+        )
+        tags = get_or_create_tags(records)
+        for slug, tag in tags.items():
+            if tag.slug != slug:
+                self.stderr.write(
+                    f'Тег {slug} заменён тегом {tag.slug} '
+                    f'с тем же названием {tag.name}'
+                )
+        ingredients = get_or_create_ingredients(records)
+        for record in records:
+            record['author'] = authors.get(
+                record['author'], self.fallback_author
+            )
+            record['pub_date'] = parse_datetime(record['pub_date'])
+        existing = set(Recipe.objects.filter(
+            Q(author__in={
+                record['author'] for record in records if record['author']
+            }),
+            Q(name__in={record['name'] for record in records}),
+            Q(pub_date__in={record['pub_date'] for record in records}),
+        ).values_list('author_id', 'name', 'pub_date'))
+        recipes, recipe_ingredients, recipe_tags = [], [], []
+        for record in records:
+            author = record['author']
+            if author and (
+                author.id, record['name'], record['pub_date']
+            ) in existing:
+                stats['existing'] += 1
+                continue
+            unknown_tags = [
+                tag['slug'] for tag in record['tags']
+                if tag['slug'] not in tags
+            ]
+            if unknown_tags:
+                stats['failed'] += 1
+                self.stderr.write(
+                    f'Рецепт {record["id"]} пропущен: не удалось создать '
+                    f'теги {", ".join(unknown_tags)}'
+                )
+                continue
+            image = self.import_image(record['image'])
+            if author is None or image is None:
+                stats['failed'] += 1
+                self.stderr.write(
+                    f'Рецепт {record["id"]} пропущен: нет автора '
+                    f'{record["author"]} или картинки'
+                )
+                continue
+            recipes.append(Recipe(
+                author=author,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                pub_date=record['pub_date'],
+                image=image,
+            ))
+            recipe_ingredients.append([
+                (
+                    ingredients[
+                        (ingredient['name'], ingredient['measurement_unit'])
+                    ],
+                    ingredient['amount']
+                )
+                for ingredient in record['ingredients']
+            ])
+            recipe_tags.append(
+                [tags[tag['slug']].id for tag in record['tags']]
+            )
+        if recipes:
+            create_recipes(recipes, recipe_ingredients, recipe_tags)
+        stats['created'] = len(recipes)
+        return stats
+
+    def import_image(self, name):
+        """Кладёт картинку в хранилище и возвращает её имя там."""
+        source = self.options['media'] and os.path.join(
+            self.options['media'], name
+        )
+        if source and os.path.exists(source):
+            field = Recipe._meta.get_field('image')
+            with open(source, 'rb') as file:
+                return media_storage.save(
+                    field.generate_filename(None, os.path.basename(name)),
+                    File(file)
+                )
+        if media_storage.exists(name):
+            return name
+        return None
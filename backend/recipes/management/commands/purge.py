@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.purge import BATCH_SIZE, purge_recipes, purge_user
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Порционное удаление пользователя или рецептов со всеми связями."""
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', type=int, help='id пользователя')
+        target.add_argument(
+            '--recipes', type=int, nargs='+', help='id рецептов'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько строк удалять в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['user'] is not None:
+            user = User.objects.filter(pk=options['user']).first()
+            if user is None:
+                raise CommandError(
+                    f'Пользователь {options["user"]} не найден'
+                )
+            stats = purge_user(user, options['batch_size'])
+        else:
+            stats = purge_recipes(
+                Recipe.objects.filter(pk__in=options['recipes']),
+                options['batch_size']
+            )
+        elapsed = time.monotonic() - started
+        for label, count in sorted(stats.items()):
+            self.stdout.write(f'{label}: {count}')
+        total = sum(stats.values())
+        self.stdout.write(
+            f'Удалено строк: {total} за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipes.counters import get_counters, recount
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Пересчёт денормализованных счётчиков и исправление расхождений."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        for model, field, actual in get_counters():
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            ).values_list('pk', flat=True).order_by('pk')
+            fixed = 0
+            chunk = []
+            for pk in drifted.iterator(chunk_size=CHUNK_SIZE):
+                chunk.append(pk)
+                if len(chunk) == CHUNK_SIZE:
+                    fixed += self.repair(model, field, actual, chunk, options)
+                    chunk = []
+            if chunk:
+                fixed += self.repair(model, field, actual, chunk, options)
+            self.stdout.write(
+                f'{model._meta.label}.{field}: расхождений {fixed}'
+            )
+
+    def repair(self, model, field, actual, pks, options):
+        if not options['dry_run']:
+            recount(model, field, actual, pks)
+        return len(pks)
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+from recipes.counters import count_subquery
+
+
+def fill_favorites_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite.objects.all(), 'recipe')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сколько раз добавили в избранное'),
+        ),
+        migrations.RunPython(fill_favorites_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:36
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+import recipes.storage
+
+
+def fill_references(apps, schema_editor):
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    counts = Counter()
+    for model, field in (('recipes.Recipe', 'image'), (settings.AUTH_USER_MODEL, 'avatar')):
+        names = apps.get_model(model).objects.exclude(
+            **{f'{field}__isnull': True}
+        ).exclude(**{field: ''}).values_list(field).annotate(
+            count=Count('pk')
+        ).values_list(field, 'count').order_by()
+        for name, count in names.iterator():
+            counts[name] += count
+    MediaFile.objects.bulk_create(
+        MediaFile(name=name, references=count)
+        for name, count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0005_shopping_list'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Имя файла')),
+                ('references', models.IntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='images', verbose_name='Картинка блюда'),
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
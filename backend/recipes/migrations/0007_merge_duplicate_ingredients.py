@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:44
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=Min('id'), count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in groups.iterator():
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep']).values_list('id', flat=True))
+        for model, owner in (
+            (RecipeIngredient, 'recipe_id'), (ShoppingListItem, 'user_id')
+        ):
+            for row in model.objects.filter(ingredient_id__in=duplicates):
+                kept = model.objects.filter(
+                    **{owner: getattr(row, owner)},
+                    ingredient_id=group['keep']
+                ).first()
+                if kept:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+                else:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_media_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:50
+
+from django.db import migrations
+
+from recipes.search import (SQLITE_FTS_FILL, SQLITE_FTS_TABLE, SQLITE_TRIGGERS,
+                            create_sqlite_trigger)
+
+POSTGRESQL_FORWARD = '''
+ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector;
+
+CREATE FUNCTION recipes_recipe_document(
+    recipe_id bigint, recipe_name text, recipe_text text
+) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', coalesce(recipe_name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_recipeingredient AS item
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = item.ingredient_id
+            WHERE item.recipe_id = $1
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(recipe_text, '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION recipes_recipe_search() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := recipes_recipe_document(NEW.id, NEW.name, NEW.text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search();
+
+CREATE FUNCTION recipes_recipeingredient_search() RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe
+    SET search_vector = recipes_recipe_document(id, name, text)
+    WHERE id IN (SELECT recipe_id FROM changed_items);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipeingredient_search_insert
+AFTER INSERT ON recipes_recipeingredient
+REFERENCING NEW TABLE AS changed_items
+FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipeingredient_search();
+
+CREATE TRIGGER recipes_recipeingredient_search_update
+AFTER UPDATE ON recipes_recipeingredient
+REFERENCING NEW TABLE AS changed_items
+FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipeingredient_search();
+
+CREATE TRIGGER recipes_recipeingredient_search_delete
+AFTER DELETE ON recipes_recipeingredient
+REFERENCING OLD TABLE AS changed_items
+FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipeingredient_search();
+
+CREATE FUNCTION recipes_ingredient_search() RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe
+    SET search_vector = recipes_recipe_document(id, name, text)
+    WHERE id IN (
+        SELECT item.recipe_id
+        FROM recipes_recipeingredient AS item
+        JOIN changed_ingredients ON changed_ingredients.id = item.ingredient_id
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_ingredient_search
+AFTER UPDATE ON recipes_ingredient
+REFERENCING NEW TABLE AS changed_ingredients
+FOR EACH STATEMENT EXECUTE PROCEDURE recipes_ingredient_search();
+
+UPDATE recipes_recipe
+SET search_vector = recipes_recipe_document(id, name, text);
+
+CREATE INDEX recipes_recipe_search_vector_idx
+ON recipes_recipe USING GIN (search_vector);
+'''
+
+POSTGRESQL_BACKWARD = '''
+DROP TRIGGER recipes_ingredient_search ON recipes_ingredient;
+DROP TRIGGER recipes_recipeingredient_search_insert
+    ON recipes_recipeingredient;
+DROP TRIGGER recipes_recipeingredient_search_update
+    ON recipes_recipeingredient;
+DROP TRIGGER recipes_recipeingredient_search_delete
+    ON recipes_recipeingredient;
+DROP TRIGGER recipes_recipe_search ON recipes_recipe;
+DROP FUNCTION recipes_ingredient_search();
+DROP FUNCTION recipes_recipeingredient_search();
+DROP FUNCTION recipes_recipe_search();
+DROP FUNCTION recipes_recipe_document(bigint, text, text);
+ALTER TABLE recipes_recipe DROP COLUMN search_vector;
+'''
+
+
+SQLITE_FORWARD = [
+    SQLITE_FTS_TABLE,
+    *map(create_sqlite_trigger, SQLITE_TRIGGERS),
+    SQLITE_FTS_FILL,
+]
+
+SQLITE_BACKWARD = [
+    *(f'DROP TRIGGER IF EXISTS {name}' for name in SQLITE_TRIGGERS),
+    'DROP TABLE recipes_recipe_fts',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, ()):
+            schema_editor.execute(statement, params=None)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({
+                'postgresql': [POSTGRESQL_FORWARD],
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run({
+                'postgresql': [POSTGRESQL_BACKWARD],
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Рецепт'), ('favorite', 'Избранное'), ('shopping_cart', 'Корзина'), ('follow', 'Подписка')], max_length=16, verbose_name='Тип объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалён')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время изменения')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Изменение',
+                'verbose_name_plural': 'Журнал изменений',
+                'ordering': ('id',),
+                'default_related_name': 'changes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['user', 'id'], name='change_user_id_idx'),
+        ),
+    ]
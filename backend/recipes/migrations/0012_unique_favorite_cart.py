@@ -0,0 +1,71 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:13
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def duplicates(model):
+    """Лишние строки (пользователь, рецепт) сверх самой ранней."""
+    groups = model.objects.values('user_id', 'recipe_id').annotate(
+        keep=Min('id'), count=Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in groups.iterator():
+        yield from model.objects.filter(
+            user_id=group['user_id'], recipe_id=group['recipe_id']
+        ).exclude(id=group['keep'])
+
+
+def remove_duplicates(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    User = apps.get_model('user', 'User')
+    for row in list(duplicates(Favorite)):
+        Recipe.objects.filter(pk=row.recipe_id).update(
+            favorites_count=F('favorites_count') - 1
+        )
+        row.delete()
+    for row in list(duplicates(ShoppingCart)):
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=row.recipe_id
+        ).values_list('ingredient_id', 'amount'):
+            ShoppingListItem.objects.filter(
+                user_id=row.user_id, ingredient_id=ingredient_id
+            ).update(amount=F('amount') - amount)
+        ShoppingListItem.objects.filter(
+            user_id=row.user_id, amount__lte=0
+        ).delete()
+        User.objects.filter(pk=row.user_id).update(
+            shopping_cart_version=F('shopping_cart_version') + 1
+        )
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_change_log'),
+        ('user', '0006_media_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'default_related_name': 'user_favorite', 'ordering': ('-pub_date',), 'verbose_name': 'Избранное', 'verbose_name_plural': 'Избранные'},
+        ),
+        migrations.AlterModelOptions(
+            name='shoppingcart',
+            options={'default_related_name': 'cart_recipes', 'ordering': ('-pub_date',), 'verbose_name': 'Корзина', 'verbose_name_plural': 'Корзина'},
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_favorite_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_shoppingcart_recipe'),
+        ),
+    ]
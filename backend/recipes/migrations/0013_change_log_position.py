@@ -0,0 +1,56 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:44
+
+from django.db import migrations, models
+from django.db.models import F
+
+SEQUENCE = 'recipes_changelogentry_position_seq'
+
+
+def fill_positions(apps, schema_editor):
+    """Старые записи получают позицию, равную id: курсоры не меняются."""
+    ChangeLogEntry = apps.get_model('recipes', 'ChangeLogEntry')
+    ChangeLogEntry.objects.update(position=F('id'), sequenced=F('created'))
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    last = ChangeLogEntry.objects.order_by('-id').values_list(
+        'id', flat=True
+    ).first() or 0
+    schema_editor.execute(f'CREATE SEQUENCE {SEQUENCE} START {last + 1}')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_unique_favorite_cart'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='changelogentry',
+            options={'default_related_name': 'changes', 'ordering': ('position',), 'verbose_name': 'Изменение', 'verbose_name_plural': 'Журнал изменений'},
+        ),
+        migrations.RemoveIndex(
+            model_name='changelogentry',
+            name='change_user_id_idx',
+        ),
+        migrations.AddField(
+            model_name='changelogentry',
+            name='position',
+            field=models.BigIntegerField(blank=True, null=True, unique=True, verbose_name='Позиция в журнале'),
+        ),
+        migrations.AddField(
+            model_name='changelogentry',
+            name='sequenced',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время получения позиции'),
+        ),
+        migrations.RunPython(fill_positions, drop_sequence),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['user', 'position'], name='change_user_position_idx'),
+        ),
+    ]
@@ -1,11 +1,17 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 from recipes.constants import (MAX_RECIPE_NAME_LENGTH, MAX_VIEW_LENGTH,
-                               MIN_COOKING_TIME, MIN_INGREDIENT_COUNT,
-                               SHORT_LINK_MAX_LENGTH, SOME_RESRICTION)
+                               MEDIA_NAME_MAX_LENGTH, MIN_COOKING_TIME,
+                               MIN_INGREDIENT_COUNT, SHORT_LINK_MAX_LENGTH,
+                               SOME_RESRICTION)
+from recipes.storage import media_storage
+from user.models import Follow
 
 User = get_user_model()
 
@@ -50,11 +56,73 @@ class Ingredient(models.Model):
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
         default_related_name = 'tags'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name[:MAX_VIEW_LENGTH]
 
 
+def row_number_filter(queryset, partition_by, order_by, lookup, value):
+    """Подзапрос с id строк, чей номер в группе подходит под условие.
+
+    Номер считает ROW_NUMBER() OVER (PARTITION BY ...) по полям
+    partition_by: на фильтр по оконной функции ORM не способен, поэтому
+    она уходит во вложенный запрос. lookup — оператор сравнения номера
+    с value.
+    """
+    ranked = queryset.annotate(row_number=Window(
+        RowNumber(), partition_by=[F(name) for name in partition_by],
+        order_by=order_by
+    )).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    return RawSQL(
+        f'SELECT "ranked"."id" FROM ({sql}) "ranked" '
+        f'WHERE "ranked"."row_number" {lookup} %s', (*params, value)
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, корзины и подписки на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, models.BooleanField()),
+                is_in_shopping_cart=Value(False, models.BooleanField()),
+                author_is_subscribed=Value(False, models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author')
+            )),
+        )
+
+    def first_per_author(self, author_ids, limit):
+        """Первые limit рецептов каждого автора одним запросом."""
+        return self.filter(id__in=row_number_filter(
+            Recipe.objects.filter(author_id__in=author_ids), ('author_id',),
+            (F('pub_date').asc(), F('id').asc()), '<=', limit
+        ))
+
+    def with_related(self):
+        """Подгружает автора, ингредиенты и тэги рецептов."""
+        return self.select_related('author').prefetch_related(
+            'recipe_ingredients__ingredient', 'tags'
+        )
+
+
 class Recipe(models.Model):
     """ Модель рецептов."""
 
@@ -72,6 +140,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка блюда',
         upload_to='images',
+        storage=media_storage,
     )
     cooking_time = models.IntegerField(
         validators=(MinValueValidator(MIN_COOKING_TIME),),
@@ -99,12 +168,28 @@ class Recipe(models.Model):
         blank=True,
         null=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Сколько раз добавили в избранное',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('pub_date',)
+        indexes = (
+            models.Index(
+                fields=('pub_date', 'id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date', 'id'),
+                name='recipe_author_pub_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name[:MAX_VIEW_LENGTH]
@@ -168,7 +253,7 @@ class BaseFavoriteShoppingCart(models.Model):
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'recipe'],
-                name='unique_user_favorite_recipe'
+                name='unique_user_%(class)s_recipe'
             )
         ]
 
@@ -176,7 +261,7 @@ class BaseFavoriteShoppingCart(models.Model):
 class Favorite(BaseFavoriteShoppingCart):
     """Избранные рецепты."""
 
-    class Meta:
+    class Meta(BaseFavoriteShoppingCart.Meta):
         default_related_name = 'user_favorite'
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
@@ -188,10 +273,167 @@ class Favorite(BaseFavoriteShoppingCart):
 class ShoppingCart(BaseFavoriteShoppingCart):
     """Корзина заказов."""
 
-    class Meta:
+    class Meta(BaseFavoriteShoppingCart.Meta):
         default_related_name = 'cart_recipes'
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
 
     def __str__(self):
         return f'Рецепт: {self.recipe} в корзине пользователя {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+
+    class Meta:
+        default_related_name = 'shopping_list'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_ingredient'
+            )
+        ]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.user}: {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика автора.
+
+    Записи добавляются при публикации рецепта; pub_date скопирована из
+    рецепта, чтобы лента читалась по одному индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        default_related_name = 'timeline'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx'
+            ),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+CHANGE_KINDS = (
+    ('recipe', 'Рецепт'),
+    ('favorite', 'Избранное'),
+    ('shopping_cart', 'Корзина'),
+    ('follow', 'Подписка'),
+)
+
+
+class ChangeLogEntry(models.Model):
+    """Запись журнала изменений для синхронизации клиентов.
+
+    Журнал только дополняется. Курсором служит position: она выдаётся
+    после коммита, поэтому идёт в порядке коммитов, а не вставок. Записи
+    без пользователя видны всем, остальные только своему пользователю.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        null=True,
+        blank=True
+    )
+    kind = models.CharField(
+        verbose_name='Тип объекта',
+        max_length=16,
+        choices=CHANGE_KINDS
+    )
+    object_id = models.BigIntegerField(verbose_name='id объекта')
+    deleted = models.BooleanField(verbose_name='Удалён', default=False)
+    created = models.DateTimeField(
+        verbose_name='Время изменения',
+        default=timezone.now,
+        db_index=True
+    )
+    position = models.BigIntegerField(
+        verbose_name='Позиция в журнале',
+        null=True,
+        blank=True,
+        unique=True
+    )
+    sequenced = models.DateTimeField(
+        verbose_name='Время получения позиции',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        default_related_name = 'changes'
+        ordering = ('position',)
+        indexes = (
+            models.Index(
+                fields=('user', 'position'), name='change_user_position_idx'
+            ),
+        )
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+
+    def __str__(self):
+        action = 'удалён' if self.deleted else 'изменён'
+        return f'{self.kind} {self.object_id} {action}'
+
+
+class MediaFile(models.Model):
+    """Файл в хранилище и число ссылающихся на него записей."""
+
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=MEDIA_NAME_MAX_LENGTH,
+        unique=True
+    )
+    references = models.IntegerField(
+        verbose_name='Число ссылок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,140 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes import changes, shopping_list
+from recipes.bulk import send_bulk_changed
+from recipes.counters import shift_counters
+from recipes.models import (ChangeLogEntry, Favorite, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, TimelineEntry)
+from recipes.storage import change_references
+from user.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+def raw_delete(queryset):
+    """DELETE одним запросом, без сборщика каскадов и сигналов."""
+    return queryset._raw_delete(queryset.db)
+
+
+def batches(queryset, batch_size):
+    """Первичные ключи кверисета порциями по возрастанию."""
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        pks = list(
+            chunk.values_list('pk', flat=True).order_by('pk')[:batch_size]
+        )
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
+
+
+def delete_in_batches(queryset, batch_size, before=None):
+    """Удаляет строки кверисета порциями, каждую в своей транзакции.
+
+    before получает порцию перед удалением и поправляет
+    зависящие от неё денормализованные данные в той же транзакции.
+    """
+    deleted = 0
+    for pks in batches(queryset, batch_size):
+        with transaction.atomic():
+            rows = queryset.model.objects.filter(pk__in=pks)
+            if before:
+                before(rows)
+            deleted += raw_delete(rows)
+    return deleted
+
+
+def release_carts(recipe_ids):
+    """Вычитает рецепты из списков покупок всех, у кого они в корзине."""
+    totals = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids, recipe__cart_recipes__isnull=False
+    ).values_list(
+        'recipe__cart_recipes__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    deltas = defaultdict(dict)
+    for user_id, ingredient_id, total in totals.iterator():
+        deltas[user_id][ingredient_id] = -total
+    users = defaultdict(list)
+    for user_id, user_deltas in deltas.items():
+        users[tuple(sorted(user_deltas.items()))].append(user_id)
+    for user_deltas, user_ids in users.items():
+        shopping_list.apply_deltas(user_ids, dict(user_deltas))
+
+
+def release_favorites(favorites):
+    shift_counters(
+        Recipe, 'favorites_count',
+        favorites.values_list('recipe_id', flat=True), -1
+    )
+
+
+def release_follows(follows):
+    shift_counters(
+        User, 'followers_count',
+        follows.values_list('following_id', flat=True), -1
+    )
+
+
+def forget_followers(follows):
+    """Сообщает подписчикам удаляемого автора, что подписки больше нет."""
+    changes.record_for_users(
+        changes.FOLLOW, follows.values_list('user_id', 'following_id'),
+        deleted=True
+    )
+
+
+def purge_recipes(queryset, batch_size=BATCH_SIZE):
+    """Удаляет рецепты кверисета вместе со всеми зависимыми строками."""
+    stats = Counter()
+    for pks in batches(queryset, batch_size):
+        with transaction.atomic():
+            release_carts(pks)
+            for model, rows in (
+                (ShoppingCart, ShoppingCart.objects),
+                (Favorite, Favorite.objects),
+                (RecipeIngredient, RecipeIngredient.objects),
+                (Recipe.tags.through, Recipe.tags.through.objects),
+                (TimelineEntry, TimelineEntry.objects),
+            ):
+                stats[model._meta.label] += raw_delete(
+                    rows.filter(recipe_id__in=pks)
+                )
+            recipes = Recipe.objects.filter(pk__in=pks)
+            rows = list(recipes.values_list('author_id', 'image'))
+            stats[Recipe._meta.label] += raw_delete(recipes)
+            shift_counters(
+                User, 'recipes_count', [row[0] for row in rows], -1
+            )
+            change_references([row[1] for row in rows], -1)
+            changes.record(changes.RECIPE, pks, deleted=True)
+        send_bulk_changed(Recipe, pks)
+    return stats
+
+
+def purge_user(user, batch_size=BATCH_SIZE):
+    """Удаляет пользователя порциями, начиная с самых больших связей."""
+    stats = purge_recipes(Recipe.objects.filter(author=user), batch_size)
+    for queryset, before in (
+        (Favorite.objects.filter(user=user), release_favorites),
+        (ShoppingCart.objects.filter(user=user), None),
+        (ShoppingListItem.objects.filter(user=user), None),
+        (TimelineEntry.objects.filter(user=user), None),
+        (Follow.objects.filter(user=user), release_follows),
+        (Follow.objects.filter(following=user), forget_followers),
+        (ChangeLogEntry.objects.filter(user=user), None),
+    ):
+        stats[queryset.model._meta.label] += delete_in_batches(
+            queryset, batch_size, before
+        )
+    with transaction.atomic():
+        _, deleted = user.delete()
+    stats.update(deleted)
+    return stats
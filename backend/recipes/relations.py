@@ -0,0 +1,111 @@
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import post_delete
+
+from recipes import changes, shopping_list
+from recipes.counters import count_subquery, recount
+from recipes.models import Favorite, Recipe
+from recipes.purge import raw_delete
+
+
+def insert_first(model, **fields):
+    """Создаёт строку сразу INSERT-ом, без проверочного SELECT.
+
+    Возвращает None, если вставку отклонило ограничение базы: строка
+    уже есть или ссылка ведёт на несуществующий объект. Внешние ключи
+    проверяются при коммите, поэтому вызывать вне внешней транзакции.
+    """
+    try:
+        with transaction.atomic(using=router.db_for_write(model)):
+            return model.objects.create(**fields)
+    except IntegrityError:
+        return None
+
+
+def delete_first(model, **fields):
+    """Удаляет строку одним DELETE и возвращает число удалённых строк.
+
+    Сборщик удаления не читает строку заранее: post_delete отправляется
+    вручную с экземпляром из тех же полей, так что обработчики счётчиков
+    и журнала срабатывают как при обычном удалении.
+    """
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        deleted = raw_delete(model.objects.filter(**fields))
+        if deleted:
+            post_delete.send(
+                sender=model, instance=model(**fields), using=using
+            )
+    return deleted
+
+
+def refresh_aggregates(model, user, recipe_ids, deleted=False):
+    """Поправляет данные, зависящие от избранного или корзины.
+
+    Счётчик избранного и список покупок пересчитываются по факту,
+    а не сдвигаются: пачка могла пересечься с параллельными запросами,
+    и bulk_create с ignore_conflicts не говорит, какие строки вставил.
+    """
+    if not recipe_ids:
+        return
+    if model is Favorite:
+        recount(
+            Recipe, 'favorites_count',
+            count_subquery(Favorite.objects.all(), 'recipe'), recipe_ids
+        )
+        kind = changes.FAVORITE
+    else:
+        shopping_list.rebuild([user.pk])
+        kind = changes.SHOPPING_CART
+    changes.record_for_users(
+        kind, [(user.pk, pk) for pk in recipe_ids], deleted=deleted
+    )
+
+
+def add_many(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину одним bulk_create.
+
+    Возвращает статус для каждого id: added, exists или not_found.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', flat=True))
+        existing = set(model.objects.filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        missing = found - existing
+        added = [pk for pk in recipe_ids if pk in missing]
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in added],
+            ignore_conflicts=True
+        )
+        refresh_aggregates(model, user, added)
+    return {
+        pk: 'added' if pk in missing
+        else 'exists' if pk in existing else 'not_found'
+        for pk in recipe_ids
+    }
+
+
+def remove_many(model, user, recipe_ids):
+    """Убирает рецепты одним DELETE; статусы removed или missing."""
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        rows = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+        removed = set(rows.values_list('recipe_id', flat=True))
+        raw_delete(rows)
+        refresh_aggregates(model, user, list(removed), deleted=True)
+    return {
+        pk: 'removed' if pk in removed else 'missing' for pk in recipe_ids
+    }
+
+
+def clear(model, user):
+    """Очищает избранное или корзину пользователя, возвращает id рецептов."""
+    with transaction.atomic():
+        rows = model.objects.filter(user=user)
+        removed = list(rows.values_list('recipe_id', flat=True))
+        raw_delete(rows)
+        refresh_aggregates(model, user, removed, deleted=True)
+    return removed
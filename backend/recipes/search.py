@@ -0,0 +1,195 @@
+import logging
+import re
+
+from django.db import connections, transaction
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from recipes.bulk import send_bulk_changed
+from recipes.models import Recipe, RecipeIngredient
+
+logger = logging.getLogger(__name__)
+
+SEARCH_WORD = re.compile(r'\w+')
+# Веса названия, ингредиентов и описания для bm25 в SQLite.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: без регистра, ё как е."""
+    return value.casefold().replace('ё', 'е')
+
+
+def sqlite_normalize(value):
+    return f"replace(replace({value}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def sqlite_ingredients(recipe_id):
+    name = sqlite_normalize('ingredient.name')
+    return f'''(
+        SELECT group_concat({name}, ' ')
+        FROM recipes_recipeingredient AS item
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = item.ingredient_id
+        WHERE item.recipe_id = {recipe_id}
+    )'''
+
+
+SQLITE_FTS_TABLE = '''CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+    name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2'
+)'''
+
+# SQLite пересоздаёт таблицу при ALTER, и триггеры на ней при этом
+# пропадают: restore_sqlite_triggers создаёт их заново после миграций.
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': f'''
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+        VALUES (
+            new.id, {sqlite_normalize('new.name')},
+            {sqlite_ingredients('new.id')}, {sqlite_normalize('new.text')}
+        );
+    END''',
+    'recipes_recipe_fts_update': f'''
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        UPDATE recipes_recipe_fts
+        SET name = {sqlite_normalize('new.name')},
+            text = {sqlite_normalize('new.text')}
+        WHERE rowid = new.id;
+    END''',
+    'recipes_recipe_fts_delete': '''
+    AFTER DELETE ON recipes_recipe BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = old.id;
+    END''',
+    **{
+        f'recipes_recipeingredient_fts_{event.lower()}': f'''
+        AFTER {event} ON recipes_recipeingredient BEGIN
+            UPDATE recipes_recipe_fts
+            SET ingredients = {sqlite_ingredients(f'{row}.recipe_id')}
+            WHERE rowid = {row}.recipe_id;
+        END'''
+        for event, row in (
+            ('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')
+        )
+    },
+    'recipes_ingredient_fts_update': f'''
+    AFTER UPDATE OF name ON recipes_ingredient BEGIN
+        UPDATE recipes_recipe_fts
+        SET ingredients = {sqlite_ingredients('recipes_recipe_fts.rowid')}
+        WHERE rowid IN (
+            SELECT recipe_id FROM recipes_recipeingredient
+            WHERE ingredient_id = new.id
+        );
+    END''',
+}
+
+SQLITE_FTS_FILL = f'''
+INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+SELECT
+    id, {sqlite_normalize('name')},
+    {sqlite_ingredients('recipes_recipe.id')}, {sqlite_normalize('text')}
+FROM recipes_recipe'''
+
+
+def create_sqlite_trigger(name):
+    return f'CREATE TRIGGER IF NOT EXISTS {name} {SQLITE_TRIGGERS[name]}'
+
+
+def missing_sqlite_triggers(connection):
+    """Триггеры FTS5, которых нет в базе; None, если нет самой таблицы."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type IN ('table', 'trigger')"
+        )
+        existing = {name for name, in cursor.fetchall()}
+    if 'recipes_recipe_fts' not in existing:
+        return None
+    return [name for name in SQLITE_TRIGGERS if name not in existing]
+
+
+def restore_sqlite_triggers(connection):
+    """Создаёт пропавшие триггеры FTS5 и перестраивает индекс.
+
+    Пока триггеров не было, изменения рецептов в индекс не попадали,
+    поэтому его содержимое заполняется заново, а закешированные
+    ответы сбрасываются.
+    """
+    missing = missing_sqlite_triggers(connection)
+    if not missing:
+        return
+    logger.warning(
+        'Триггеры поиска пропали и будут созданы заново: %s',
+        ', '.join(missing)
+    )
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for name in missing:
+                cursor.execute(create_sqlite_trigger(name))
+            cursor.execute('DELETE FROM recipes_recipe_fts')
+            cursor.execute(SQLITE_FTS_FILL)
+        send_bulk_changed(Recipe)
+
+
+def postgresql_search(queryset, query):
+    tsquery = "websearch_to_tsquery('russian', %s)"
+    return queryset.filter(RawSQL(
+        f'"recipes_recipe"."search_vector" @@ {tsquery}', (query,),
+        output_field=BooleanField()
+    )).annotate(search_rank=RawSQL(
+        f'ts_rank("recipes_recipe"."search_vector", {tsquery})', (query,),
+        output_field=FloatField()
+    ))
+
+
+def sqlite_search(queryset, query):
+    """Поиск по FTS5: все слова запроса как префиксы, без стемминга.
+
+    Таблица FTS5 присоединяется к рецептам: bm25 в коррелированном
+    подзапросе пересчитывал бы MATCH для каждой найденной строки.
+    """
+    match = ' '.join(
+        f'"{word}"*' for word in SEARCH_WORD.findall(normalize(query))
+    )
+    weights = ', '.join(map(str, FTS_WEIGHTS))
+    return queryset.extra(
+        tables=['recipes_recipe_fts'],
+        where=[
+            '"recipes_recipe_fts"."rowid" = "recipes_recipe"."id"',
+            '"recipes_recipe_fts" MATCH %s',
+        ],
+        params=[match],
+    ).annotate(search_rank=RawSQL(
+        f'-bm25("recipes_recipe_fts", {weights})', (),
+        output_field=FloatField()
+    ))
+
+
+def fallback_search(queryset, query):
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query) | Q(
+            pk__in=RecipeIngredient.objects.filter(
+                ingredient__name__icontains=query
+            ).values('recipe_id')
+        )
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+SEARCH_BACKENDS = {
+    'postgresql': postgresql_search,
+    'sqlite': sqlite_search,
+}
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, по убыванию ранга search_rank.
+
+    В PostgreSQL ищет по tsvector с русской морфологией, в SQLite —
+    по таблице FTS5; обе поддерживаются триггерами из миграции.
+    """
+    if not SEARCH_WORD.search(query):
+        return queryset.none()
+    backend = SEARCH_BACKENDS.get(
+        connections[queryset.db].vendor, fallback_search
+    )
+    return backend(queryset, query).order_by('-search_rank', '-id')
@@ -0,0 +1,100 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+CHUNK_SIZE = 1000
+
+
+def apply_deltas(user_ids, deltas):
+    """Прибавляет к строкам списка покупок изменения количества.
+
+    Сначала без конфликтов вставляются недостающие строки с нулём,
+    потом одним UPDATE прибавляются дельты, так что параллельные изменения
+    одного списка не теряются.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids for ingredient_id in deltas
+            ],
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        )
+        items.update(amount=F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(delta))
+                for ingredient_id, delta in deltas.items()
+            ),
+            output_field=IntegerField()
+        ))
+        items.filter(amount__lte=0).delete()
+        User.objects.filter(pk__in=user_ids).update(
+            shopping_cart_version=F('shopping_cart_version') + 1
+        )
+
+
+def get_recipe_amounts(recipe_id):
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def change_cart(user_id, recipe_id, sign):
+    """Учитывает добавление (sign=1) или удаление (sign=-1) рецепта."""
+    apply_deltas([user_id], {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+    })
+
+
+def change_recipe(recipe_id, deltas):
+    """Учитывает изменение ингредиентов рецепта во всех корзинах с ним."""
+    if not any(deltas.values()):
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True).order_by('user_id')
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(user_id)
+        if len(chunk) == CHUNK_SIZE:
+            apply_deltas(chunk, deltas)
+            chunk = []
+    apply_deltas(chunk, deltas)
+
+
+def get_actual_totals(user_ids):
+    """Список покупок, посчитанный напрямую по корзине."""
+    return RecipeIngredient.objects.filter(
+        recipe__cart_recipes__user__in=user_ids
+    ).values_list(
+        'recipe__cart_recipes__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+
+
+def rebuild(user_ids):
+    """Полностью пересобирает списки покупок пользователей."""
+    with transaction.atomic():
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in get_actual_totals(user_ids)
+        )
+        User.objects.filter(pk__in=user_ids).update(
+            shopping_cart_version=F('shopping_cart_version') + 1
+        )
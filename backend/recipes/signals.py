@@ -0,0 +1,183 @@
+from django.db import connections
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import changes, images, shopping_list, timeline
+from recipes.counters import change_counter
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            User)
+from recipes.search import restore_sqlite_triggers
+from recipes.storage import change_references
+from user.models import Follow
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'favorites_count', 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+        timeline.schedule_fan_out([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.following_id),
+            'followers_count', 1
+        )
+        timeline.follow(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.following_id), 'followers_count', -1
+    )
+    timeline.unfollow(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_created(instance, created, **kwargs):
+    if created:
+        shopping_list.change_cart(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_deleted(instance, **kwargs):
+    shopping_list.change_cart(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_changing(instance, **kwargs):
+    instance.previous = instance.pk and RecipeIngredient.objects.filter(
+        pk=instance.pk
+    ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(instance, **kwargs):
+    deltas = {instance.ingredient_id: instance.amount}
+    if instance.previous:
+        ingredient_id, amount = instance.previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    shopping_list.change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(instance, **kwargs):
+    shopping_list.change_recipe(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, update_fields=None, **kwargs):
+    if update_fields is None or 'image' in update_fields:
+        images.schedule_variants(instance.image)
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(instance, update_fields=None, **kwargs):
+    if update_fields is None or 'avatar' in update_fields:
+        images.schedule_variants(instance.avatar)
+
+
+MEDIA_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def media_changing(sender, instance, update_fields=None, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    instance.previous_media = None
+    if update_fields is None or field in update_fields:
+        instance.previous_media = instance.pk and sender.objects.filter(
+            pk=instance.pk
+        ).values_list(field, flat=True).first() or ''
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def media_saved(sender, instance, **kwargs):
+    previous = instance.previous_media
+    current = getattr(instance, MEDIA_FIELDS[sender]).name or ''
+    if previous is not None and previous != current:
+        change_references([current], 1)
+        change_references([previous], -1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def media_deleted(sender, instance, **kwargs):
+    change_references([getattr(instance, MEDIA_FIELDS[sender]).name], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_logged(instance, **kwargs):
+    changes.record(changes.RECIPE, [instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deletion_logged(instance, **kwargs):
+    changes.record(changes.RECIPE, [instance.pk], deleted=True)
+
+
+CHANGE_KINDS = {
+    Favorite: (changes.FAVORITE, 'recipe_id'),
+    ShoppingCart: (changes.SHOPPING_CART, 'recipe_id'),
+    Follow: (changes.FOLLOW, 'following_id'),
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def user_relation_logged(sender, instance, created, **kwargs):
+    if created:
+        kind, field = CHANGE_KINDS[sender]
+        changes.record_for_users(
+            kind, [(instance.user_id, getattr(instance, field))]
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def user_relation_deletion_logged(sender, instance, **kwargs):
+    kind, field = CHANGE_KINDS[sender]
+    changes.record_for_users(
+        kind, [(instance.user_id, getattr(instance, field))], deleted=True
+    )
+
+
+@receiver(post_migrate)
+def search_triggers_restored(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name == 'recipes' and connection.vendor == 'sqlite':
+        restore_sqlite_triggers(connection)
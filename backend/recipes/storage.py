@@ -0,0 +1,178 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from functools import partial
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import (Case, Count, F, FileField, IntegerField, Value,
+                              When)
+from django.utils.deconstruct import deconstructible
+
+from recipes.images import get_variant_names
+
+HASH_CHUNK_SIZE = 1024 * 1024
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$')
+
+
+def hash_file(content):
+    """sha256 содержимого файла, читаемого частями."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_hashed_name(name, digest):
+    directory, basename = os.path.split(name)
+    extension = os.path.splitext(basename)[1].lower()
+    return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, именующее файлы по хешу содержимого.
+
+    Одинаковые картинки записываются на диск один раз, а число ссылок
+    на каждый файл хранится в MediaFile и меняется при сохранении
+    и удалении записей, ссылающихся на него.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        """Имя не меняется: файл с тем же хешем — та же картинка.
+
+        FileSystemStorage._save спрашивает новое имя, когда файл успел
+        записать параллельный запрос; ошибка прерывает этот цикл.
+        """
+        if is_hashed_name(name) and self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        """Сохраняет файл, если такого ещё нет, и берёт на него ссылку.
+
+        Ссылка держится до коммита транзакции, которая запишет запись
+        с этим файлом: блокировка строки MediaFile не даёт параллельному
+        удалению последней ссылки стереть файл, пока запись не видна.
+        Вне транзакции ссылку держать негде, и она не берётся.
+        """
+        name = get_hashed_name(name, hash_file(content))
+        if connection.in_atomic_block:
+            change_references([name], 1)
+            transaction.on_commit(partial(change_references, [name], -1))
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return name
+
+    def delete(self, name):
+        """Файл удаляется только когда на него не осталось ссылок."""
+
+    def remove(self, name):
+        """Удаляет файл вместе с его уменьшенными копиями."""
+        for variants in get_variant_names(name).values():
+            for variant in variants.values():
+                super().delete(variant)
+        super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
+
+
+def change_references(names, delta):
+    """Меняет число ссылок на файлы и удаляет файлы без ссылок.
+
+    Строки MediaFile блокируются до конца транзакции; строку, которую
+    успело удалить remove_files, создаём заново и блокируем ещё раз.
+    """
+    pending = Counter(name for name in names if name)
+    if not pending:
+        return
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    with transaction.atomic():
+        while pending:
+            MediaFile.objects.bulk_create(
+                [MediaFile(name=name) for name in pending],
+                ignore_conflicts=True
+            )
+            locked = list(MediaFile.objects.select_for_update().filter(
+                name__in=pending
+            ).order_by('name').values_list('name', flat=True))
+            files = MediaFile.objects.filter(name__in=locked)
+            files.update(references=F('references') + Case(
+                *(
+                    When(name=name, then=Value(delta * pending[name]))
+                    for name in locked
+                ),
+                output_field=IntegerField()
+            ))
+            for name in locked:
+                del pending[name]
+            if delta < 0:
+                released = list(files.filter(
+                    references__lte=0
+                ).values_list('name', flat=True))
+                transaction.on_commit(partial(remove_files, released))
+
+
+def remove_files(names):
+    """Удаляет файлы, на которые так и не появилось новых ссылок.
+
+    Число ссылок перепроверяется под блокировкой строки: за время
+    между коммитом и удалением файл мог снова понадобиться.
+    """
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    for name in names:
+        with transaction.atomic():
+            released = MediaFile.objects.select_for_update().filter(
+                name=name, references__lte=0
+            )
+            if released.exists():
+                media_storage.remove(name)
+                released.delete()
+
+
+def get_media_fields():
+    """Поля моделей, хранящие файлы в media_storage."""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, FileField) and field.storage is media_storage
+    ]
+
+
+def get_referenced_names(model, field):
+    return model.objects.exclude(**{f'{field}__isnull': True}).exclude(
+        **{field: ''}
+    ).values_list(field, flat=True)
+
+
+def rebuild_references():
+    """Пересчитывает число ссылок на файлы по записям в базе."""
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    counts = Counter()
+    for model, field in get_media_fields():
+        names = get_referenced_names(model, field).annotate(
+            count=Count('pk')
+        ).values_list(field, 'count').order_by()
+        for name, count in names.iterator():
+            counts[name] += count
+    with transaction.atomic():
+        MediaFile.objects.all().delete()
+        MediaFile.objects.bulk_create(
+            (
+                MediaFile(name=name, references=count)
+                for name, count in counts.items()
+            ),
+            batch_size=1000
+        )
+    return len(counts)
@@ -0,0 +1,190 @@
+import heapq
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+
+from recipes.constants import (PAGE_SIZE, TIMELINE_BACKFILL_SIZE,
+                               TIMELINE_BATCH_SIZE, TIMELINE_MAX_LENGTH,
+                               TIMELINE_TRIM_INTERVAL)
+from recipes.models import Recipe, TimelineEntry, User, row_number_filter
+from user.models import Follow
+
+logger = logging.getLogger(__name__)
+executor = None
+
+
+def is_large(followers_count):
+    """Рецепты авторов с большим числом подписчиков читаются при запросе."""
+    return followers_count > settings.TIMELINE_FANOUT_LIMIT
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей не больше TIMELINE_MAX_LENGTH."""
+    return TimelineEntry.objects.filter(id__in=row_number_filter(
+        TimelineEntry.objects.filter(user_id__in=user_ids), ('user_id',),
+        (F('pub_date').desc(), F('recipe_id').desc()),
+        '>', TIMELINE_MAX_LENGTH
+    )).delete()
+
+
+def should_trim(recipe_ids):
+    """Обрезать ленты не на каждой публикации, а в среднем раз в интервал.
+
+    Поэтому длина ленты может ненадолго превысить предел примерно на
+    TIMELINE_TRIM_INTERVAL записей.
+    """
+    return len(recipe_ids) >= TIMELINE_TRIM_INTERVAL or any(
+        pk % TIMELINE_TRIM_INTERVAL == 0 for pk in recipe_ids
+    )
+
+
+def fan_out(recipe_ids):
+    """Добавляет рецепты в ленты подписчиков их авторов.
+
+    Подписчики читаются порциями по id, записи вставляются пачками;
+    авторы с большим числом подписчиков пропускаются.
+    """
+    by_author = defaultdict(list)
+    for pk, author_id, pub_date, followers_count in Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('pk', 'author_id', 'pub_date', 'author__followers_count'):
+        if not is_large(followers_count):
+            by_author[author_id].append((pk, pub_date))
+    written = 0
+    for author_id, recipes in by_author.items():
+        followers = Follow.objects.filter(following_id=author_id).order_by(
+            'user_id'
+        ).values_list('user_id', flat=True)
+        batch_size = max(TIMELINE_BATCH_SIZE // len(recipes), 1)
+        last_id = 0
+        while True:
+            user_ids = list(followers.filter(user_id__gt=last_id)[:batch_size])
+            if not user_ids:
+                break
+            with transaction.atomic():
+                written += len(TimelineEntry.objects.bulk_create(
+                    (
+                        TimelineEntry(
+                            user_id=user_id, recipe_id=pk, pub_date=pub_date
+                        )
+                        for user_id in user_ids
+                        for pk, pub_date in recipes
+                    ),
+                    batch_size=TIMELINE_BATCH_SIZE,
+                    ignore_conflicts=True
+                ))
+                if should_trim([pk for pk, _ in recipes]):
+                    trim(user_ids)
+            last_id = user_ids[-1]
+    return written
+
+
+def run_fan_out(recipe_ids):
+    try:
+        return fan_out(recipe_ids)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.TIMELINE_WORKERS,
+            thread_name_prefix='timeline'
+        )
+    return executor
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            'Не удалось разложить рецепты по лентам',
+            exc_info=future.exception()
+        )
+
+
+def submit(recipe_ids):
+    if not settings.TIMELINE_WORKERS:
+        return fan_out(recipe_ids)
+    future = get_executor().submit(run_fan_out, recipe_ids)
+    future.add_done_callback(log_failure)
+    return future
+
+
+def schedule_fan_out(recipe_ids):
+    """Раскладывает рецепты по лентам в фоне после коммита транзакции."""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: submit(recipe_ids))
+
+
+def follow(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора, на которого подписались."""
+    followers_count = User.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers_count is None or is_large(followers_count):
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-id').values_list(
+                'pk', 'pub_date'
+            )[:TIMELINE_BACKFILL_SIZE]
+        ),
+        ignore_conflicts=True
+    )
+
+
+def unfollow(user_id, author_id):
+    """Убирает из ленты рецепты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        recipe_id__in=Recipe.objects.filter(author_id=author_id).values('pk')
+    ).delete()
+
+
+def after(position, date_field, id_field):
+    """Условие keyset-пагинации: записи старше позиции (дата, id)."""
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(**{
+        date_field: pub_date, f'{id_field}__lt': pk
+    })
+
+
+def read_feed(user, position=None, limit=PAGE_SIZE):
+    """Ключи (pub_date, id) рецептов ленты от новых к старым.
+
+    Сливает материализованную ленту с рецептами крупных авторов,
+    которые не раскладываются по лентам, а читаются при запросе.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    large_authors = Follow.objects.filter(
+        user=user,
+        following__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).values('following_id')
+    recipes = Recipe.objects.filter(author__in=large_authors)
+    if position is not None:
+        entries = entries.filter(after(position, 'pub_date', 'recipe_id'))
+        recipes = recipes.filter(after(position, 'pub_date', 'id'))
+    sources = (
+        entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit],
+        recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:limit],
+    )
+    keys, seen = [], set()
+    for key in heapq.merge(*sources, reverse=True):
+        if key[1] not in seen:
+            seen.add(key[1])
+            keys.append(key)
+    return keys[:limit]
@@ -0,0 +1,97 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from user.models import Follow, User
+
+RECIPES_PER_AUTHOR = 12
+
+
+@pytest.fixture(autouse=True)
+def local_settings(settings, tmp_path):
+    settings.CACHES = {
+        alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias,
+        }
+        for alias in ('default', 'versions')
+    }
+    settings.TIMELINE_WORKERS = 0
+    settings.MEDIA_ROOT = str(tmp_path)
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    return settings
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password',
+    )
+
+
+@pytest.fixture
+def user():
+    return create_user(0)
+
+
+@pytest.fixture
+def authors():
+    return [create_user(number) for number in range(1, 6)]
+
+
+@pytest.fixture
+def recipes(authors):
+    tags = [
+        Tag.objects.create(name=f'Тег {number}', slug=f'tag-{number}')
+        for number in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г'
+        )
+        for number in range(4)
+    ]
+    recipes = []
+    for author in authors:
+        for number in range(RECIPES_PER_AUTHOR):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='images/recipe.jpg',
+            )
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                )
+                for ingredient in ingredients[:number % len(ingredients) + 1]
+            )
+            recipes.append(recipe)
+    return recipes
+
+
+@pytest.fixture
+def follows(user, authors):
+    return [
+        Follow.objects.create(user=user, following=author)
+        for author in authors
+    ]
+
+
+@pytest.fixture
+def anonymous_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
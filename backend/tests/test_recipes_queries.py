@@ -0,0 +1,46 @@
+import pytest
+
+PAGE_SIZES = (1, 6, 30)
+RECIPES_STEP = 7
+# Счётчик страницы, рецепты с автором, ингредиенты рецептов,
+# сами ингредиенты и тэги; плоская сборка читает ингредиенты одним JOIN.
+LIST_QUERIES = {False: 5, True: 4}
+RETRIEVE_QUERIES = {False: 4, True: 3}
+
+
+def get_client(request, authenticated):
+    return request.getfixturevalue(
+        'user_client' if authenticated else 'anonymous_client'
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('flat', (False, True))
+@pytest.mark.parametrize('authenticated', (False, True))
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_recipe_list_queries(
+    request, settings, django_assert_num_queries, recipes, follows,
+    flat, authenticated, limit
+):
+    settings.FLAT_RECIPE_SERIALIZATION = flat
+    client = get_client(request, authenticated)
+    with django_assert_num_queries(LIST_QUERIES[flat]):
+        response = client.get('/api/recipes/', {'limit': limit})
+    assert response.status_code == 200
+    assert len(response.json()['results']) == limit
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('flat', (False, True))
+@pytest.mark.parametrize('authenticated', (False, True))
+def test_recipe_retrieve_queries(
+    request, settings, django_assert_num_queries, recipes, follows,
+    flat, authenticated
+):
+    settings.FLAT_RECIPE_SERIALIZATION = flat
+    client = get_client(request, authenticated)
+    for recipe in recipes[::RECIPES_STEP]:
+        with django_assert_num_queries(RETRIEVE_QUERIES[flat]):
+            response = client.get(f'/api/recipes/{recipe.id}/')
+        assert response.status_code == 200
+        assert response.json()['id'] == recipe.id
@@ -0,0 +1,29 @@
+import pytest
+
+# Страница авторов со счётчиком, число подписок и рецепты
+# всех авторов страницы одним запросом с ROW_NUMBER().
+SUBSCRIPTIONS_QUERIES = 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('recipes_limit', (None, 1, 3, 100))
+@pytest.mark.parametrize('limit', (1, 3, 10))
+def test_subscriptions_queries(
+    django_assert_num_queries, user_client, recipes, follows,
+    limit, recipes_limit
+):
+    params = {'limit': limit}
+    if recipes_limit is not None:
+        params['recipes_limit'] = recipes_limit
+    with django_assert_num_queries(SUBSCRIPTIONS_QUERIES):
+        response = user_client.get('/api/users/subscriptions/', params)
+    assert response.status_code == 200
+    per_author = len(recipes) // len(follows)
+    authors = response.json()['results']
+    assert len(authors) == min(limit, len(follows))
+    for author in authors:
+        assert author['is_subscribed'] is True
+        assert author['recipes_count'] == per_author
+        assert len(author['recipes']) == min(
+            recipes_limit or per_author, per_author
+        )
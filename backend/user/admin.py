@@ -23,11 +23,11 @@ class UserAdmin(UserAdmin):
 
     @admin.display(description='Сколько подписчиков')
     def get_user_following(self, object):
-        return object.following.count()
+        return object.followers_count
 
     @admin.display(description='Сколько рецептов')
     def get_user_recipes(self, object):
-        return object.recipe.count()
+        return object.recipes_count
 
 
 @admin.register(Follow)
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+from recipes.counters import count_subquery
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Follow = apps.get_model('user', 'Follow')
+    User.objects.update(
+        recipes_count=count_subquery(Recipe.objects.all(), 'author'),
+        followers_count=count_subquery(Follow.objects.all(), 'following'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_follow_options'),
+        ('recipes', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сколько подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сколько рецептов'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
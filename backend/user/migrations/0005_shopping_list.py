@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='shopping_cart_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия корзины'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:36
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_shopping_list'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(default=None, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='users/avatars/', verbose_name='Аватарка'),
+        ),
+    ]
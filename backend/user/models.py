@@ -2,6 +2,8 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
 
+from recipes.storage import media_storage
+
 from .constants import (MAX_EMAIL_LENGTH, NAME_LENGTH, PASSWORD_LENGTH,
                         USERNAME_REGEX)
 from .validators import not_allowed_user_name
@@ -44,9 +46,25 @@ class User(AbstractUser):
     avatar = models.ImageField(
         verbose_name='Аватарка',
         upload_to='users/avatars/',
+        storage=media_storage,
         null=True,
         default=None
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Сколько рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Сколько подписчиков',
+        default=0,
+        editable=False
+    )
+    shopping_cart_version = models.PositiveIntegerField(
+        verbose_name='Версия корзины',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('date_joined',)